@@ -1,22 +1,28 @@
 import dataclasses
+import logging
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from typing import Any, Optional, Annotated
 
 from flask import g, request, jsonify
 from pydantic import BaseModel, Field, AfterValidator
-from sqlalchemy import select
+from sqlalchemy import select, insert, update, Select
 from werkzeug.exceptions import BadRequest
 
-from aisysprojserver import models, telemetry
+from aisysprojserver import models, telemetry, env_executor, config, run_pool, archive, rating
 from aisysprojserver.active_env import ActiveEnvironment
 from aisysprojserver.agent_account import AgentAccount
-from aisysprojserver.agent_data import AgentData
-from aisysprojserver.env_interface import GenericEnvironment, RunData, ActionHistoryEntry, ActionResult
-from aisysprojserver.models import AgentDataModel, RunModel, KeyValAccess
+from aisysprojserver.env_interface import GenericEnvironment, RunData, ActionResult, ActionHistoryEntry
+from aisysprojserver.models import AgentDataModel, RunModel, KeyValAccess, AgentAccountModel
+from aisysprojserver.run import get_action_history, get_number_of_steps, append_action, get_history_limit, \
+    extend_action_history, encode_state, decode_state
 from aisysprojserver.telemetry import MonitoredBlueprint
 from aisysprojserver.util import json_load, json_dump, PYDANTIC_REQUEST_CONFIG, parse_request
 
+logger = logging.getLogger(__name__)
+
 bp = MonitoredBlueprint('act', __name__)
 
 _run_id_regex = re.compile('^(?P<runid>[0-9]+)#(?P<actionno>[0-9]+)$')
@@ -145,6 +151,47 @@ class AbandonAction:
     run: str
 
 
+@dataclasses.dataclass
+class PreparedAction:
+    """ An action with its effects, which have been computed, but not yet stored """
+    action: ActionV1 | AbandonAction
+    accepted: bool = False      # False if the action was rejected (e.g. invalid action)
+    messages: list[Message] = dataclasses.field(default_factory=list)
+    number_of_steps: int = 0    # length of the action history when the effects were computed
+    action_result: Optional[ActionResult] = None
+    abandon_outcome: Any = None
+    run_data: Optional[RunData] = None     # the run data that was used for computing the effects
+
+
+@dataclasses.dataclass(frozen=True)
+class WorkingRun:
+    """ The decoded data of a run that was updated by the current request (avoids reloading it for the response) """
+    run_data: RunData
+    number_of_steps: int
+
+
+# shared by all requests (created on first use)
+_evaluation_pool: Optional[ThreadPoolExecutor] = None
+_evaluation_pool_lock = threading.Lock()
+
+
+def _get_evaluation_pool(max_workers: int) -> ThreadPoolExecutor:
+    global _evaluation_pool
+    with _evaluation_pool_lock:
+        if _evaluation_pool is None:
+            _evaluation_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='action-evaluation')
+        return _evaluation_pool
+
+
+def select_active_runs(agent: str) -> Select:
+    """ query for the identifiers, ``outstanding_action`` flags and numbers of steps of the agent's active runs
+    (uses the index ``ix_runs_agent_finished_identifier``) """
+    return select(RunModel.identifier, RunModel.outstanding_action, RunModel.number_of_steps).where(
+        RunModel.agent == agent,
+        RunModel.finished == False,  # noqa: E712
+    ).order_by(RunModel.identifier)
+
+
 class ActManager:
     def __init__(self, env_id: str, request: RequestV1):
         self.env_id = env_id
@@ -159,44 +206,74 @@ class ActManager:
         self.account.require_active()
 
         self.env: GenericEnvironment = self.active_env.get_env_instance()
+        self.history_limit: Optional[int] = get_history_limit(self.env.settings)
 
         self.messages: list[Message] = []
         self.finished_runs: dict[str, Any] = {}
-
-    def get_run_model_and_history(
-            self, action: ActionV1 | AbandonAction, session
-    ) -> Optional[tuple[RunModel, list[tuple[Any, Any]]]]:
-        run_model: Optional[RunModel] = session.get(RunModel, action.run)
-
+        # runs that were updated by this request (by run identifier)
+        self.working_set: dict[int, WorkingRun] = {}
+
+    def call_env(self, method: str, *args) -> Any:
+        """ calls the environment via the configured executor (see ``env_executor``) """
+        return env_executor.get_executor().call(self.active_env, method, *args)
+
+    def load_run_models(self, actions: list[ActionV1 | AbandonAction], session,
+                        for_update: bool = False) -> dict[int, RunModel]:
+        """ loads all runs referenced by the actions with a single query """
+        run_ids = {int(action.run) for action in actions if action.run.isdigit()}
+        if not run_ids:
+            return {}
+        query = select(RunModel).where(RunModel.identifier.in_(run_ids))
+        if for_update:
+            query = query.with_for_update()
+        return {int(run_model.identifier): run_model for run_model in session.scalars(query)}
+
+    def begin_write_transaction(self, session):
+        """ write transactions of the same agent must not run concurrently """
+        models.begin_write_transaction(session, (AgentAccountModel, self.account.identifier))
+
+    def check_run_model(self, prepared: PreparedAction, run_model: Optional[RunModel]) -> Optional[RunModel]:
+        action = prepared.action
         if not run_model:
-            self.messages.append(Message(run=action.run, content='Invalid run id', type=MessageType.error))
+            prepared.messages.append(Message(run=action.run, content='Invalid run id', type=MessageType.error))
             return None
         if run_model.agent != self.account.identifier:
-            self.messages.append(
+            prepared.messages.append(
                 Message(run=action.run, content='This run does not belong to your agent', type=MessageType.error))
             return None
 
-        history: list[tuple[Any, Any]] = json_load(str(run_model.history))  # type: ignore
-
-        if isinstance(action, ActionV1) and action.act_no != len(history):
-            self.messages.append(Message(
-                run=action.run,
-                content=f'Wrong action number {action.act_no} '
-                        '(the action might have been for an earlier action request)',
-                type=MessageType.error
-            ))
+        if isinstance(action, ActionV1) and action.act_no != get_number_of_steps(run_model):
+            prepared.messages.append(self.wrong_action_number_message(action))
             return None
 
-        return run_model, history
+        return run_model
 
-    def get_action_result(self, action: ActionV1, run_data: RunData) -> Optional[ActionResult]:
-        action_result = self.env.act(action.action, run_data)
+    def wrong_action_number_message(self, action: ActionV1) -> Message:
+        return Message(
+            run=action.run,
+            content=f'Wrong action number {action.act_no} (the action might have been for an earlier action request)',
+            type=MessageType.error
+        )
 
+    def get_action_result(self, prepared: PreparedAction, run_data: RunData) -> Optional[ActionResult]:
+        action = prepared.action
+        assert isinstance(action, ActionV1)
+        try:
+            action_result = self.call_env('act', action.action, run_data)
+        except env_executor.EnvUnavailable as e:
+            action_result = ActionResult.error(str(e.description))
+        return self.check_action_result(prepared, action_result)
+
+    def check_action_result(self, prepared: PreparedAction, action_result: ActionResult) -> Optional[ActionResult]:
+        """ returns None if the action was not accepted """
+        action = prepared.action
         if action_result.new_state is None:  # error
             if action_result.message:
-                self.messages.append(Message(run=action.run, content=action_result.message, type=MessageType.error))
+                prepared.messages.append(
+                    Message(run=action.run, content=action_result.message, type=MessageType.error)
+                )
             else:
-                self.messages.append(Message(
+                prepared.messages.append(Message(
                     run=action.run,
                     content='Internal server error when trying to update the state',
                     type=MessageType.error
@@ -204,62 +281,193 @@ class ActManager:
             return None
 
         if action_result.message:
-            self.messages.append(Message(run=action.run, content=action_result.message, type=MessageType.info))
+            prepared.messages.append(Message(run=action.run, content=action_result.message, type=MessageType.info))
 
         return action_result
 
-    def process_action(self, action: ActionV1 | AbandonAction):
+    def process_actions(self, actions: list[ActionV1 | AbandonAction]):
+        """ processes all actions of a request.
+
+        The effects of the actions are computed first, without holding any locks.
+        Afterwards, they are stored in a single (locked) transaction, where every action gets its own savepoint,
+        so an action that fails does not roll back the others (the client gets an error message for its run
+        and a new action request, as the run is unchanged).
+        If a run was modified concurrently in the meantime (e.g. because the same action was submitted twice),
+        the action is rejected.
+        """
+        prepared_actions = self.prepare_actions(actions)
         do_cleanup: bool = False
 
         with models.Session() as session:
-            # we do a separate transaction for each action - less efficient, but
-            # more robust if we want to parallelize
+            self.begin_write_transaction(session)
+            run_models = self.load_run_models(
+                [prepared.action for prepared in prepared_actions if prepared.accepted], session, for_update=True
+            )
+            for prepared in prepared_actions:
+                if prepared.accepted:
+                    try:
+                        with session.begin_nested():
+                            do_cleanup |= self.store_action(prepared, run_models.get(int(prepared.action.run)), session)
+                    except Exception:
+                        logger.exception(f'Failed to store an action for run {prepared.action.run}')
+                        self.discard_action(prepared)
+                self.messages.extend(prepared.messages)
+            session.commit()
 
-            # Note: we do not use the Run class as a wrapper because everything should happen in the same session
-            # (which is not supported by the wrapper)
+        if do_cleanup and config.get().ARCHIVE_INTERVAL is None:
+            archive.archive_runs(self.active_env.identifier)
 
-            if (r := self.get_run_model_and_history(action, session)) is not None:
-                run_model, history = r
-            else:
-                return
-
-            run_data = RunData(
-                action_history=[ActionHistoryEntry(action, extra) for action, extra in history],
-                state=json_load(str(run_model.state)),
-                outcome=None,
-                agent_name='/'.join(run_model.agent.split('/')[1:]),
-                run_id=int(run_model.identifier),
-            )
+    def prepare_actions(self, actions: list[ActionV1 | AbandonAction]) -> list[PreparedAction]:
+        """ computes the effects of the actions (without modifying the database).
 
-            if isinstance(action, AbandonAction):
-                assert self.env.settings.CAN_ABANDON_RUNS
-                outcome = self.env.get_abandon_outcome(run_data)
-                self.messages.append(Message(
-                    run=action.run, content='Run abandoned (as requested by client)', type=MessageType.warning)
+        Actions for different runs are independent, so they are evaluated concurrently
+        if the environment supports it (see ``evaluates_concurrently``).
+        The order of the prepared actions (and therefore of the messages) is the order of the actions.
+        """
+        prepared_actions = [PreparedAction(action) for action in actions]
+        with models.Session() as session:
+            run_models = self.load_run_models(actions, session)
+            session.commit()    # we do not want to hold a lock while the environment computes the effects
+
+        # Note: we do not use the Run class as a wrapper because everything should happen in the same session
+        # (which is not supported by the wrapper)
+        to_evaluate: list[tuple[PreparedAction, RunData]] = []
+        seen_runs: set[str] = set()
+        for prepared in prepared_actions:
+            action = prepared.action
+            if isinstance(action, ActionV1) and action.run in seen_runs:
+                # the run is changed by an earlier action of the request, so the action number is outdated
+                prepared.messages.append(self.wrong_action_number_message(action))
+                continue
+            seen_runs.add(action.run)
+            run_model = self.check_run_model(
+                prepared, run_models.get(int(action.run)) if action.run.isdigit() else None
+            )
+            if run_model is not None:
+                prepared.number_of_steps = get_number_of_steps(run_model)
+                prepared.run_data = RunData(
+                    # the history is loaded with a separate session (if needed) because we might be in another thread
+                    action_history=get_action_history(run_model, None, self.history_limit),
+                    state=decode_state(run_model.state, run_model.state_blob),   # type: ignore
+                    outcome=None,
+                    agent_name='/'.join(run_model.agent.split('/')[1:]),
+                    run_id=int(run_model.identifier),
                 )
+                to_evaluate.append((prepared, prepared.run_data))
+
+        if self.uses_act_batch:
+            self.evaluate_action_batch([(p, rd) for p, rd in to_evaluate if isinstance(p.action, ActionV1)])
+            to_evaluate = [(p, rd) for p, rd in to_evaluate if not isinstance(p.action, ActionV1)]
+
+        if len(to_evaluate) > 1 and self.evaluates_concurrently:
+            pool = _get_evaluation_pool(config.get().ACTION_EVALUATION_THREADS)
+            # list(...) waits for all evaluations and re-raises their exceptions
+            list(pool.map(lambda args: self.evaluate_action(*args), to_evaluate))
+        else:
+            for prepared, run_data in to_evaluate:
+                self.evaluate_action(prepared, run_data)
+
+        return prepared_actions
+
+    @property
+    def evaluates_concurrently(self) -> bool:
+        """ True if the actions of a request are evaluated in parallel threads
+        (environment instances are shared, so this has to be enabled explicitly unless they run in worker processes)
+        """
+        if config.get().ACTION_EVALUATION_THREADS <= 1:
+            return False
+        return self.env.settings.CONCURRENT_ACTION_EVALUATION or \
+            isinstance(env_executor.get_executor(), env_executor.ProcessPoolEnvExecutor)
+
+    @property
+    def uses_act_batch(self) -> bool:
+        """ True if the environment evaluates many actions at once (otherwise, they are evaluated concurrently) """
+        return type(self.env).act_batch is not GenericEnvironment.act_batch
+
+    def evaluate_action_batch(self, batch: list[tuple[PreparedAction, RunData]]):
+        if not batch:
+            return
+        with telemetry.measure_action_processing(self.active_env.env_class_refstr):    # measures the whole batch
+            try:
+                action_results = self.call_env(
+                    'act_batch', [(prepared.action.action, run_data) for prepared, run_data in batch]   # type: ignore
+                )
+            except env_executor.EnvUnavailable as e:
+                action_results = [ActionResult.error(str(e.description))] * len(batch)
+        assert len(action_results) == len(batch), 'act_batch returned the wrong number of results'
+        for (prepared, _), action_result in zip(batch, action_results):
+            prepared.action_result = self.check_action_result(prepared, action_result)
+            prepared.accepted = prepared.action_result is not None
+
+    def evaluate_action(self, prepared: PreparedAction, run_data: RunData):
+        """ lets the environment compute the effects of an action (can be called concurrently) """
+        action = prepared.action
+        if isinstance(action, AbandonAction):
+            assert self.env.settings.CAN_ABANDON_RUNS
+            prepared.abandon_outcome = self.call_env('get_abandon_outcome', run_data)
+            prepared.messages.append(Message(
+                run=action.run, content='Run abandoned (as requested by client)', type=MessageType.warning)
+            )
+            prepared.accepted = True
+        else:
+            with telemetry.measure_action_processing(self.active_env.env_class_refstr):
+                prepared.action_result = self.get_action_result(prepared, run_data)
+            prepared.accepted = prepared.action_result is not None
 
-                self.finished_runs[action.run] = outcome
-                do_cleanup = self.process_outcome(outcome, run_model, session)
-
-            else:
-                action_result = self.get_action_result(action, run_data)
-                if action_result is None:
-                    return
+    def store_action(self, prepared: PreparedAction, run_model: Optional[RunModel], session) -> bool:
+        """ returns True iff cleanup is recommended """
+        action = prepared.action
+        if run_model is None or run_model.finished or get_number_of_steps(run_model) != prepared.number_of_steps:
+            prepared.messages = [Message(
+                run=action.run,
+                content='The run was modified by a concurrent request (the action might have been sent twice)',
+                type=MessageType.error
+            )]
+            return False
 
-                run_model.state = json_dump(action_result.new_state)    # type: ignore
-                history.append((action.action, action_result.action_extra_info))
-                run_model.history = json_dump(history)  # type: ignore
+        do_cleanup: bool = False
+        if isinstance(action, AbandonAction):
+            self.finished_runs[action.run] = prepared.abandon_outcome
+            do_cleanup = self.process_outcome(prepared.abandon_outcome, run_model, session)
+        else:
+            action_result = prepared.action_result
+            assert action_result is not None
+            run_model.state, run_model.state_blob = encode_state(     # type: ignore
+                action_result.new_state, self.env.settings.STATE_CODEC, self.env.settings.STATE_COMPRESSION_THRESHOLD
+            )
+            append_action(run_model, action.action, action_result.action_extra_info, session, self.history_limit)
 
-                if action_result.outcome is not None:
-                    self.finished_runs[action.run] = action_result.outcome
-                    do_cleanup = self.process_outcome(action_result.outcome, run_model, session)
+            if action_result.outcome is not None:
+                self.finished_runs[action.run] = action_result.outcome
+                do_cleanup = self.process_outcome(action_result.outcome, run_model, session)
+            else:
+                assert prepared.run_data is not None
+                self.working_set[int(run_model.identifier)] = WorkingRun(
+                    run_data=dataclasses.replace(
+                        prepared.run_data,
+                        state=action_result.new_state,
+                        action_history=extend_action_history(
+                            prepared.run_data.action_history,
+                            ActionHistoryEntry(action.action, action_result.action_extra_info),
+                            int(run_model.number_of_steps), int(run_model.identifier), self.history_limit,
+                        ),
+                    ),
+                    number_of_steps=int(run_model.number_of_steps),
+                )
 
-            run_model.outstanding_action = False  # type: ignore
-            session.add(run_model)
-            session.commit()
+        run_model.outstanding_action = False  # type: ignore
+        return do_cleanup
 
-        if do_cleanup:
-            AgentData(self.account.identifier).delete_nonrecent_runs()
+    def discard_action(self, prepared: PreparedAction):
+        """ forgets the effects of an action whose savepoint has been rolled back """
+        self.finished_runs.pop(prepared.action.run, None)
+        if prepared.action.run.isdigit():
+            self.working_set.pop(int(prepared.action.run), None)
+        prepared.messages = [Message(
+            run=prepared.action.run,
+            content='Internal server error when trying to store the action',
+            type=MessageType.error
+        )]
 
     def process_outcome(self, outcome: Any, run_model: RunModel, session) -> bool:
         """ returns True iff cleanup is recommended """
@@ -272,15 +480,11 @@ class ActManager:
         if agent_data.total_runs >= self.env.settings.MIN_RUNS_FOR_FULLY_EVALUATED:
             agent_data.fully_evaluated = True  # type: ignore
 
-        results = json_load(str(agent_data.recent_results))
-        results.append(outcome)
-
-        match self.env.settings.RATING_STRATEGY:
-            case 'average':
-                results = results[-self.env.settings.MIN_RUNS_FOR_FULLY_EVALUATED:]
-                agent_data.current_rating = sum(results) / len(results)
-            case other:
-                raise Exception(f'Unsupported RATING_STRATEGY {other}')
+        strategy = rating.get_rating_strategy(self.env.settings)
+        rating_state = strategy.update(
+            rating.decode_state(strategy, agent_data.rating_state, agent_data.recent_results), outcome  # type: ignore
+        )
+        agent_data.current_rating = strategy.get_rating(rating_state)   # type: ignore
 
         if agent_data.fully_evaluated:
             if self.env.settings.RATING_OBJECTIVE == 'max':
@@ -290,18 +494,21 @@ class ActManager:
                 best_rating = min(float(agent_data.best_rating), float(agent_data.current_rating))
             agent_data.best_rating = best_rating    # type: ignore
 
-        agent_data.recent_results = json_dump(results)   # type: ignore
+        agent_data.rating_state = rating.encode_state(strategy, rating_state)    # type: ignore
+        agent_data.recent_results = None    # type: ignore
 
         # UPDATE HISTORY OF RECENT RUNS
         runs = json_load(str(agent_data.recently_finished_runs))
         runs.append(run_model.identifier)
         agent_data.recently_finished_runs = json_dump(runs[-20:])   # type: ignore
 
-        kva = KeyValAccess(session)
+        kva = KeyValAccess(session, for_update=True)
         key = self.active_env.recent_runs_key
         runs2 = json_load(kva[key] or '[]')
         runs2.append(run_model.identifier)
         kva[key] = json_dump(runs2[-20:])
+        version_key = self.active_env.content_version_key
+        kva[version_key] = str(int(kva[version_key] or 0) + 1)
 
         session.add(agent_data)
 
@@ -311,74 +518,184 @@ class ActManager:
     def get_agent_data_model(self, session) -> AgentDataModel:
         agent_data_model = session.get(AgentDataModel, self.account.identifier)
         if not agent_data_model:
+            strategy = rating.get_rating_strategy(self.env.settings)
             agent_data_model = AgentDataModel(
                 identifier=self.account.identifier,
                 environment=self.env_id,
                 total_runs=0,
                 fully_evaluated=False,
                 recently_finished_runs='[]',
-                recent_results='[]',
+                rating_state=rating.encode_state(strategy, strategy.initial_state()),
                 best_rating=self.env.settings.INITIAL_RATING,
                 current_rating=self.env.settings.INITIAL_RATING,
             )
         return agent_data_model
 
+    def load_runs(self, run_ids: list[int], session) -> list[RunModel]:
+        """ loads the runs that are still active (ordered by their identifiers) """
+        if not run_ids:
+            return []
+        return list(session.scalars(
+            select(RunModel).where(RunModel.identifier.in_(run_ids), RunModel.finished == False)  # noqa: E712
+            .order_by(RunModel.identifier)
+        ))
+
+    def load_active_runs(self, session, for_update: bool = False) -> list[tuple[int, bool, Optional[int]]]:
+        """ the identifiers, ``outstanding_action`` flags and numbers of steps of the agent's active runs
+        (only the columns that are needed to pick the runs - the state etc. is only loaded for the chosen runs) """
+        query = select_active_runs(self.account.identifier)
+        if for_update:
+            query = query.with_for_update()
+        return [
+            (int(identifier), bool(outstanding), steps) for identifier, outstanding, steps in session.execute(query)
+        ]
+
+    def create_initial_states(self, number: int) -> tuple[list[tuple[Optional[str], Optional[bytes]]], list[Any]]:
+        """ returns the encoded (see ``encode_state``) and the decoded initial states for ``number`` new runs.
+        States are claimed from the run pool if possible, the others are generated without holding any locks. """
+        encoded_states: list[tuple[Optional[str], Optional[bytes]]] = []
+        if self.env.settings.RUN_POOL_SIZE:
+            with models.Session() as session:
+                models.begin_write_transaction(session)
+                # pooled states are stored as they are (and only decoded for the working set)
+                encoded_states = run_pool.claim_states(session, self.env_id, number)
+                session.commit()
+        states: list[Any] = [decode_state(text, blob) for text, blob in encoded_states]
+        if len(states) < number:
+            with telemetry.measure_run_creation_duration(self.active_env.env_class_refstr):
+                new_states = self.call_env('new_runs', number - len(states))
+            settings = self.env.settings
+            encoded_states += [
+                encode_state(state, settings.STATE_CODEC, settings.STATE_COMPRESSION_THRESHOLD) for state in new_states
+            ]
+            states += new_states
+        return encoded_states, states
+
+    def insert_new_runs(self, encoded_states: list[tuple[Optional[str], Optional[bytes]]], states: list[Any],
+                        session) -> list[int]:
+        """ inserts runs with the given initial states (with a single statement if possible)
+        and adds them to the working set. Returns the sorted identifiers.
+        ``encoded_states`` are the values for the ``state`` and ``state_blob`` columns (see ``encode_state``)
+        and ``states`` the corresponding decoded states (for the working set). """
+        values: list[dict[str, Any]] = []
+        for state_text, state_blob in encoded_states:
+            values.append({
+                'environment': self.env_id,
+                'agent': self.account.identifier,
+                'finished': False,
+                'outstanding_action': True,     # action requests are sent for all new runs
+                'state': state_text,
+                'state_blob': state_blob,
+                'number_of_steps': 0,
+                'outcome': json_dump(None),
+            })
+        if not values:
+            return []
+        # the identifiers are matched to the states by position
+        # (several runs can have the same initial state, so they cannot be matched via their states)
+        identifiers: list[int]
+        dialect = session.get_bind().dialect
+        if dialect.insert_returning and dialect.name == 'sqlite':
+            # SQLite assigns increasing identifiers in the order of the rows, but the order of the returned rows
+            # is unspecified (and with sort_by_parameter_order, SQLAlchemy would insert the rows one by one)
+            rows = session.execute(insert(RunModel).returning(RunModel.identifier), values)
+            identifiers = sorted(int(identifier) for identifier, in rows)
+        elif dialect.insert_returning:
+            rows = session.execute(
+                insert(RunModel).returning(RunModel.identifier, sort_by_parameter_order=True), values
+            )
+            identifiers = [int(identifier) for identifier, in rows]
+        else:   # e.g. SQLite < 3.35
+            new_runs = [RunModel(**v) for v in values]
+            session.add_all(new_runs)
+            session.flush()     # assigns the identifiers
+            identifiers = [int(run.identifier) for run in new_runs]
+
+        agent_name = '/'.join(self.account.identifier.split('/')[1:])
+        for identifier, state in zip(identifiers, states):
+            self.working_set[identifier] = WorkingRun(RunData([], state, None, identifier, agent_name), 0)
+        return sorted(identifiers)
+
+    def get_action_requests(self, runs: list[tuple[int, Optional[int]]]) -> list[ActionRequestV1]:
+        """ ``runs`` are pairs of identifiers and numbers of steps (as stored in the database).
+        Runs from the working set are not reloaded (unless they have been modified by a concurrent request).
+        No locks are held while the environment computes the action requests,
+        so runs that have been finished by a concurrent request in the meantime are skipped. """
+        to_load = {
+            identifier for identifier, number_of_steps in runs
+            if identifier not in self.working_set or self.working_set[identifier].number_of_steps != number_of_steps
+        }
+        with models.Session() as session:
+            loaded_runs: dict[int, WorkingRun] = {
+                int(run.identifier): WorkingRun(
+                    # the history is loaded with a separate session (if needed) because this session is closed
+                    RunData(get_action_history(run, None, self.history_limit),
+                            decode_state(run.state, run.state_blob), None,   # type: ignore
+                            run_id=int(run.identifier), agent_name='/'.join(run.agent.split('/')[1:])),
+                    get_number_of_steps(run),
+                )
+                for run in self.load_runs(sorted(to_load), session)
+            }
+        working_runs = [
+            loaded_runs[identifier] if identifier in to_load else self.working_set[identifier]
+            for identifier, _ in runs if identifier in loaded_runs or identifier not in to_load
+        ]
+        if not working_runs:
+            return []
+
+        action_requests = self.call_env('get_action_requests', [wr.run_data for wr in working_runs])
+        assert len(action_requests) == len(working_runs), 'get_action_requests returned the wrong number of results'
+        return [
+            ActionRequestV1(run=str(wr.run_data.run_id), act_no=wr.number_of_steps, percept=ar.content)
+            for wr, ar in zip(working_runs, action_requests)
+        ]
+
     def get_act_response(self) -> ResponseV1:
+        """ The environment calls (for new runs and action requests) happen without holding the write lock,
+        which is only taken for inserting the new runs and for marking the runs with outstanding actions. """
         response = ResponseV1(messages=self.messages, finished_runs=self.finished_runs)
         max_requests: int = self.env.settings.NUMBER_OF_ACTION_REQUESTS
         if not self.offer_parallel_runs:
             max_requests = 1
 
         with models.Session() as session:
-            def serialize_run(run: RunModel) -> ActionRequestV1:
-                run.outstanding_action = True   # type: ignore
-                session.add(run)
-                history = json_load(str(run.history))
-                rd = RunData([ActionHistoryEntry(a, e) for a, e in history], json_load(str(run.state)), None,
-                             run_id=int(run.identifier), agent_name='/'.join(run.agent.split('/')[1:]))
-                ar = self.env.get_action_request(rd)
-                return ActionRequestV1(run=str(run.identifier), act_no=len(history), percept=ar.content)
-
-            query = select(RunModel).where(
-                RunModel.finished == False,  # noqa: E712
-                RunModel.agent == self.account.identifier
-            )
-            runs: list[RunModel] = list(session.scalars(query))
-            runs.sort(key=lambda run: int(run.identifier))
-
-            runs_with_outstanding_action = [run for run in runs if run.outstanding_action]
-            if runs_with_outstanding_action:
-                for run in runs_with_outstanding_action[:max_requests]:
-                    response.action_requests.append(serialize_run(run))
-                for run in runs:
-                    response.active_runs.append(str(run.identifier))
-                session.commit()
-                return response
-
-            while len(runs) < max_requests:
-                with telemetry.measure_run_creation_duration(self.active_env.env_class_refstr):
-                    state = self.env.new_run()
-                new_run = RunModel(
-                    environment=self.env_id,
-                    agent=self.account.identifier,
-                    finished=False,
-                    outstanding_action=False,
-                    state=json_dump(state),
-                    history='[]',
-                    outcome=json_dump(None)
-                )
-                session.add(new_run)
-                session.commit()
-                runs.append(new_run)
-
-            for run in runs:
-                response.active_runs.append(str(run.identifier))
-            runs = runs[:max_requests]
-            for run in runs:
-                response.action_requests.append(serialize_run(run))
+            active_runs = self.load_active_runs(session)
             session.commit()
+
+        runs_with_outstanding_action = [
+            (identifier, number_of_steps) for identifier, outstanding, number_of_steps in active_runs if outstanding
+        ]
+        if runs_with_outstanding_action:
+            response.active_runs.extend(str(identifier) for identifier, _, _ in active_runs)
+            response.action_requests.extend(self.get_action_requests(runs_with_outstanding_action[:max_requests]))
             return response
 
+        encoded_states: list[tuple[Optional[str], Optional[bytes]]] = []
+        states: list[Any] = []
+        if len(active_runs) < max_requests:
+            encoded_states, states = self.create_initial_states(max_requests - len(active_runs))
+
+        with models.Session() as session:
+            self.begin_write_transaction(session)
+            # a concurrent request of the agent might have created runs in the meantime
+            # (then, the surplus states are discarded so that we do not exceed NUMBER_OF_ACTION_REQUESTS)
+            active_runs = self.load_active_runs(session, for_update=True)
+            runs = [(identifier, number_of_steps) for identifier, _, number_of_steps in active_runs[:max_requests]]
+            if runs:
+                session.execute(
+                    update(RunModel).where(RunModel.identifier.in_([identifier for identifier, _ in runs]))
+                    .values(outstanding_action=True)
+                )
+            missing = max_requests - len(runs)
+            new_runs = self.insert_new_runs(encoded_states[:missing], states[:missing], session)
+            session.commit()
+
+        response.active_runs.extend(str(identifier) for identifier, _, _ in active_runs)
+        response.active_runs.extend(str(identifier) for identifier in new_runs)
+        runs.extend((identifier, 0) for identifier in new_runs)
+        response.action_requests.extend(self.get_action_requests(runs))
+        return response
+
 
 @bp.route('/act/<env_id>', methods=['GET', 'PUT'])
 def act(env_id: str):
@@ -407,15 +724,10 @@ def act(env_id: str):
         client=request_data.client
     )
 
-    if request_data.to_abandon:
-        if not actor.env.settings.CAN_ABANDON_RUNS:
-            raise BadRequest('This environment does not support abandoning runs')
-        for run in request_data.to_abandon:
-            actor.process_action(AbandonAction(run))
+    if request_data.to_abandon and not actor.env.settings.CAN_ABANDON_RUNS:
+        raise BadRequest('This environment does not support abandoning runs')
 
-    for action in request_data.actions:
-        with telemetry.measure_action_processing(actor.active_env.env_class_refstr):
-            actor.process_action(action)
+    actor.process_actions([AbandonAction(run) for run in request_data.to_abandon] + list(request_data.actions))
 
     response = actor.get_act_response()
     if protocol_version == 0:
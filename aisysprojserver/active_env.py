@@ -4,11 +4,17 @@ import sqlalchemy
 from werkzeug.exceptions import BadRequest
 
 import aisysprojserver.models as models
-from aisysprojserver.agent_data import get_all_agentdata_for_env
-from aisysprojserver.env_interface import GenericEnvironment, EnvInfo, EnvData
+from aisysprojserver import telemetry, render_cache
+from aisysprojserver.agent_data import get_agent_data_summaries_for_env
+from aisysprojserver.env_interface import GenericEnvironment, EnvInfo, EnvData, AbbreviatedRunData
 from aisysprojserver.util import json_load
 from aisysprojserver.plugins import PluginManager
-from aisysprojserver.run import Run
+from aisysprojserver.run import load_abbreviated_run_data
+
+# Environment instances are cached per process because plugins might do expensive initializations.
+# Maps environment identifiers to (cache key, instance), where the cache key changes
+# whenever the environment is re-created with a different configuration or plugins are reloaded.
+_env_instances: dict[str, tuple[tuple, GenericEnvironment]] = {}
 
 
 class ActiveEnvironment(models.ModelMixin[models.ActiveEnvironmentModel]):
@@ -27,6 +33,10 @@ class ActiveEnvironment(models.ModelMixin[models.ActiveEnvironmentModel]):
                 if not overwrite:
                     raise BadRequest(f'Environment {identifier} already exists')
                 session.delete(ae)
+                # pre-generated runs might not fit the new configuration
+                session.execute(sqlalchemy.delete(models.PooledRunModel).where(
+                    models.PooledRunModel.environment == identifier
+                ))
             session.commit()
 
             ae = models.ActiveEnvironmentModel(identifier=identifier,
@@ -40,6 +50,8 @@ class ActiveEnvironment(models.ModelMixin[models.ActiveEnvironmentModel]):
             session.add(ae)
             session.commit()
 
+        _env_instances.pop(identifier, None)
+        render_cache.clear(identifier)
         return ActiveEnvironment(identifier)
 
     @property
@@ -58,21 +70,46 @@ class ActiveEnvironment(models.ModelMixin[models.ActiveEnvironmentModel]):
     def recent_runs_key(self) -> str:
         return self.identifier + '#recentruns'
 
-    def get_env_instance(self) -> GenericEnvironment:
+    @property
+    def content_version_key(self) -> str:
+        return self.identifier + '#version'
+
+    def get_content_version(self) -> int:
+        """ changes whenever a run is finished (see ``render_cache.py``) """
+        with models.Session() as session:
+            return int(models.KeyValAccess(session)[self.content_version_key] or 0)
+
+    @property
+    def instance_key(self) -> tuple[str, str, str, int]:
+        """ changes whenever the environment instance has to be re-created """
         model = self._require_model()
-        ge: type[GenericEnvironment] = PluginManager.get(str(model.env_class))
+        return str(model.env_class), str(model.config), str(model.displayname), PluginManager.reload_counter
 
-        return ge(EnvInfo(self.display_name, self.identifier),
-                  json_load(str(model.config)))
+    def get_env_instance(self) -> GenericEnvironment:
+        model = self._require_model()
+        key = self.instance_key
+        if (cached := _env_instances.get(self.identifier)) is not None and cached[0] == key:
+            telemetry.report_env_instance_cache(str(model.env_class), hit=True)
+            return cached[1]
 
-    def get_env_data(self) -> EnvData:
-        with models.Session() as session:
-            kva = models.KeyValAccess(session)
-            run_ids = json_load(kva[self.recent_runs_key] or '[]')
-        runs = [Run(i).to_abbreviated_run_data() for i in run_ids]
+        telemetry.report_env_instance_cache(str(model.env_class), hit=False)
+        ge: type[GenericEnvironment] = PluginManager.get(str(model.env_class))
+        env = ge(EnvInfo(self.display_name, self.identifier),
+                 json_load(str(model.config)))
+        _env_instances[self.identifier] = (key, env)
+        return env
+
+    def get_env_data(self, include_recent_runs: bool = True) -> EnvData:
+        runs: list[AbbreviatedRunData] = []
+        if include_recent_runs:
+            with models.Session() as session:
+                kva = models.KeyValAccess(session)
+                run_ids = json_load(kva[self.recent_runs_key] or '[]')
+                run_data = load_abbreviated_run_data(run_ids, session)
+            runs = [run_data[i] for i in run_ids if i in run_data]
 
         return EnvData(
-            agents=[ad.to_agent_data_summary() for ad in get_all_agentdata_for_env(self.identifier)],
+            agents=get_agent_data_summaries_for_env(self.identifier, include_recent_runs),
             recent_runs=runs,
         )
 
@@ -1,16 +1,20 @@
 import subprocess
+from typing import Iterator
 
-from flask import g, jsonify, request
-from sqlalchemy import text
+import sqlalchemy
+from flask import g, jsonify, request, Response
 from werkzeug.exceptions import NotFound
 
-from aisysprojserver import config, models
+from aisysprojserver import config, models, archive
 from aisysprojserver.active_env import ActiveEnvironment, get_all_active_envs
 from aisysprojserver.agent_account import get_all_agentaccounts_for_env
-from aisysprojserver.agent_data import get_all_agentdata, AgentData
+from aisysprojserver.agent_data import AgentData
 from aisysprojserver.authentication import require_admin_auth
 from aisysprojserver.group import get_all_groups
+from aisysprojserver.rating import migrate_all_rating_states
+from aisysprojserver.run import migrate_all_legacy_histories
 from aisysprojserver.telemetry import MonitoredBlueprint
+from aisysprojserver.util import json_dump, json_load
 from aisysprojserver.website import cache
 
 ERROR_BUFFER: list[str] = []
@@ -38,7 +42,7 @@ def get_env_results(active_env: ActiveEnvironment):
         raise NotFound()
 
     result: dict[str, dict] = {}
-    for agent in active_env.get_env_data().agents:
+    for agent in active_env.get_env_data(include_recent_runs=False).agents:
         result[agent.agent_name] = {
             'rating': agent.agent_rating,
             'fully-evaluated': agent.fully_evaluated,
@@ -62,19 +66,107 @@ def results():
     return jsonify({ae.identifier: get_env_results(ae) for ae in envs_list})
 
 
+# the export is sent in chunks of roughly this size (in bytes)
+_EXPORT_CHUNK_SIZE: int = 64 * 1024
+
+
+def _export_lines(env_id: str, include_runs: bool) -> Iterator[str]:
+    """ NDJSON lines (first the agents, then the finished runs if ``include_runs``) """
+    with models.Session() as session:
+        for agent in session.scalars(
+            sqlalchemy.select(models.AgentDataModel).where(models.AgentDataModel.environment == env_id)
+            .order_by(models.AgentDataModel.identifier).execution_options(yield_per=1000)
+        ):
+            yield json_dump({
+                'type': 'agent',
+                'agent': '/'.join(str(agent.identifier).split('/')[1:]),
+                'rating': agent.best_rating,
+                'current-rating': agent.current_rating,
+                'fully-evaluated': agent.fully_evaluated,
+                'total-runs': agent.total_runs,
+            }) + '\n'
+
+        if not include_runs:
+            return
+        for run_id, agent_id, outcome in session.execute(
+            sqlalchemy.select(models.RunModel.identifier, models.RunModel.agent, models.RunModel.outcome)
+            .where(models.RunModel.environment == env_id, models.RunModel.finished == True)  # noqa: E712
+            .order_by(models.RunModel.identifier).execution_options(yield_per=1000)
+        ):
+            yield json_dump({
+                'type': 'run', 'run': run_id, 'agent': '/'.join(agent_id.split('/')[1:]), 'outcome': json_load(outcome)
+            }) + '\n'
+
+    for record in archive.iter_archived_runs(env_id):
+        yield json_dump({
+            'type': 'run', 'run': record['run'], 'agent': '/'.join(record['agent'].split('/')[1:]),
+            'outcome': record['outcome'],
+        }) + '\n'
+
+
+def _export_chunks(lines: Iterator[str]) -> Iterator[str]:
+    chunk: list[str] = []
+    size = 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= _EXPORT_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    yield ''.join(chunk)
+
+
+@bp.route('/export/<env_id>')
+def export(env_id: str):
+    """ streams the results of all agents (and optionally the outcomes of all finished runs) as NDJSON """
+    g.isJSON = True
+    require_admin_auth()
+    if not ActiveEnvironment(env_id).exists():
+        raise NotFound()
+    content = request.get_json()
+    include_runs = bool(content and content.get('include-runs'))
+    return Response(_export_chunks(_export_lines(env_id, include_runs)), mimetype='application/x-ndjson')
+
+
 @bp.route('/removenonrecentruns')
 def removenonrecentruns():
+    """ moves the finished non-recent runs into the archive (see ``archive.py``).
+    The database file only shrinks after ``/vacuum``. """
     g.isJSON = True
     require_admin_auth()
     content = request.get_json()
-    if not (content and content['just-vacuum']):
-        for agent_data in get_all_agentdata():
-            agent_data.delete_nonrecent_runs()
-    with models.Session() as session:
-        session.execute(text('VACUUM'))
+    if content and content.get('just-vacuum'):     # for older clients
+        models.run_maintenance()
+        return jsonify({'result': 'done'})
+    return jsonify({'result': 'done', 'archived-runs': archive.archive_all()})
+
+
+@bp.route('/vacuum')
+def vacuum():
+    """ VACUUM and ANALYZE the database (note: this blocks all other requests until it is done) """
+    g.isJSON = True
+    require_admin_auth()
+    models.run_maintenance()
     return jsonify({'result': 'done'})
 
 
+@bp.route('/migraterunhistories')
+def migraterunhistories():
+    """ moves the action histories of old runs into the ``run_steps`` table """
+    g.isJSON = True
+    require_admin_auth()
+    return jsonify({'result': 'done', 'migrated-runs': migrate_all_legacy_histories()})
+
+
+@bp.route('/migrateratingstates')
+def migrateratingstates():
+    """ converts the recent results of agents into compact rating states """
+    g.isJSON = True
+    require_admin_auth()
+    return jsonify({'result': 'done', 'migrated-agents': migrate_all_rating_states()})
+
+
 @bp.route('/getenvs')
 @cache.cached(timeout=10)
 def getenvs():
@@ -99,7 +191,7 @@ def deleteunusedagents(env_id: str):
         if not agent_data.exists():
             account.delete()
             continue
-        if agent_data.to_agent_data_summary().total_number_of_runs == 0:
+        if agent_data.to_agent_data_summary(include_recent_runs=False).total_number_of_runs == 0:
             account.delete()
             agent_data.delete()
 
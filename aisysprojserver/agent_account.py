@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import secrets
+import time
 from enum import IntEnum
 from typing import Optional
 
@@ -8,6 +9,7 @@ import sqlalchemy
 from flask import request
 from werkzeug.exceptions import Unauthorized, BadRequest
 
+from aisysprojserver import config
 from aisysprojserver.authentication import require_password_match, default_pwd_hash
 import aisysprojserver.models as models
 
@@ -21,8 +23,21 @@ class AgentStatus(IntEnum):
     ACTIVE = 1
 
 
+# Successful authentications are cached to avoid a database lookup for every request.
+# Maps agent identifiers to (password hash, status, expiry time).
+# Changes to accounts invalidate the entries, but only in the current process,
+# so the timeout (``Config.AUTH_CACHE_TIMEOUT``) should be short.
+_auth_cache: dict[str, tuple[str, int, float]] = {}
+
+
+def _invalidate_auth_cache(identifier: str):
+    _auth_cache.pop(identifier, None)
+
+
 class AgentAccount(models.ModelMixin[models.AgentAccountModel]):
+    identifier: str
     _authenticated: bool = False
+    _cached_status: Optional[int] = None    # set if the account was authenticated via the cache
 
     def __init__(self, environment: str, agentname: str, is_client: bool = False):
         models.ModelMixin.__init__(self, models.AgentAccountModel)
@@ -47,6 +62,9 @@ class AgentAccount(models.ModelMixin[models.AgentAccountModel]):
                 raise BadRequest('Did not expect an agent to be specified in the request body')
         account = AgentAccount(environment, agent, is_client=True)
 
+        if isinstance(content.get('pwd'), str) and account._try_cached_authentication(content['pwd']):
+            return account
+
         if not account.exists():
             raise Unauthorized(description='unknown agent')
 
@@ -61,8 +79,26 @@ class AgentAccount(models.ModelMixin[models.AgentAccountModel]):
             require_password_match(pwd, str(account._require_model().password))
             account._authenticated = True
 
+            if (timeout := config.get().AUTH_CACHE_TIMEOUT) > 0:
+                _auth_cache[account.identifier] = (
+                    str(account._require_model().password), int(account._require_model().status), time.time() + timeout
+                )
+
         return account
 
+    def _try_cached_authentication(self, pwd: str) -> bool:
+        if (entry := _auth_cache.get(self.identifier)) is None:
+            return False
+        pwd_hash, status, expiry = entry
+        if expiry < time.time():
+            _invalidate_auth_cache(self.identifier)
+            return False
+        if default_pwd_hash(pwd) != pwd_hash:
+            return False   # wrong password (or different hashing scheme) -> let the normal authentication fail
+        self._authenticated = True
+        self._cached_status = status
+        return True
+
     def is_authenticated(self) -> bool:
         return self._authenticated
 
@@ -73,6 +109,8 @@ class AgentAccount(models.ModelMixin[models.AgentAccountModel]):
             )
 
     def is_active(self) -> bool:
+        if self._cached_status is not None:
+            return self._cached_status == AgentStatus.ACTIVE
         return int(self._require_model().status) == AgentStatus.ACTIVE
 
     def require_active(self):
@@ -101,17 +139,20 @@ class AgentAccount(models.ModelMixin[models.AgentAccountModel]):
             session.add(ac)
             session.commit()
 
+        _invalidate_auth_cache(self.identifier)
         return password
 
     def block(self):
         def block(ac: models.AgentAccountModel):
             ac.status = AgentStatus.LOCKED  # type: ignore
         self._change_model(block)
+        _invalidate_auth_cache(self.identifier)
 
     def unblock(self):
         def unblock(ac: models.AgentAccountModel):
             ac.status = AgentStatus.ACTIVE  # type: ignore
         self._change_model(unblock)
+        _invalidate_auth_cache(self.identifier)
 
     def delete(self):
         print(f'Deleting agent {self.identifier}')
@@ -119,6 +160,7 @@ class AgentAccount(models.ModelMixin[models.AgentAccountModel]):
         with models.Session() as session:
             session.execute(cmd)
             session.commit()
+        _invalidate_auth_cache(self.identifier)
 
 
 def get_all_agentaccounts_for_env(env_id: str) -> list[AgentAccount]:
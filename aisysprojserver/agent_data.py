@@ -3,8 +3,8 @@ from __future__ import annotations
 import sqlalchemy
 
 from aisysprojserver import models
-from aisysprojserver.env_interface import AgentDataSummary
-from aisysprojserver.run import Run
+from aisysprojserver.env_interface import AgentDataSummary, AbbreviatedRunData
+from aisysprojserver.run import load_abbreviated_run_data
 from aisysprojserver.util import json_load
 
 
@@ -19,19 +19,17 @@ class AgentData(models.ModelMixin[models.AgentDataModel]):
     def display_name(self) -> str:
         return '/'.join(self.identifier.split('/')[1:])
 
-    def to_agent_data_summary(self) -> AgentDataSummary:
-        m = self._require_model()
-
-        recent_runs = [Run(i).to_abbreviated_run_data() for i in json_load(str(m.recently_finished_runs))]
+    @property
+    def total_runs(self) -> int:
+        return int(self._require_model().total_runs)
 
-        return AgentDataSummary(
-            agent_name=self.display_name,
-            agent_rating=float(m.best_rating),
-            current_agent_rating=float(m.current_rating),
-            recent_runs=list(reversed(recent_runs)),
-            total_number_of_runs=int(m.total_runs),
-            fully_evaluated=bool(m.fully_evaluated),
-        )
+    def to_agent_data_summary(self, include_recent_runs: bool = True) -> AgentDataSummary:
+        m = self._require_model()
+        runs: dict[int, AbbreviatedRunData] = {}
+        if include_recent_runs:
+            with models.Session() as session:
+                runs = load_abbreviated_run_data(json_load(str(m.recently_finished_runs)), session)
+        return _model_to_agent_data_summary(m, runs)
 
     def delete(self, session=None):
         cmd = sqlalchemy.delete(models.AgentDataModel).where(models.AgentDataModel.identifier == self.identifier)
@@ -42,19 +40,32 @@ class AgentData(models.ModelMixin[models.AgentDataModel]):
                 session.execute(cmd)
                 session.commit()
 
-    def delete_nonrecent_runs(self, session=None):
-        keep = [rr.run_id for rr in self.to_agent_data_summary().recent_runs]
-        cmd = sqlalchemy.delete(models.RunModel).where(
-            models.RunModel.agent == self.identifier,
-            models.RunModel.finished == True,  # noqa: E712
-            models.RunModel.identifier.not_in(keep),
-        )
-        if session:
-            session.execute(cmd)
-        else:
-            with models.Session() as session:
-                session.execute(cmd)
-                session.commit()
+
+def _model_to_agent_data_summary(m: models.AgentDataModel, runs: dict[int, AbbreviatedRunData]) -> AgentDataSummary:
+    """ ``runs`` should contain the recently finished runs of the agent (if they should be included) """
+    recent_runs = [runs[i] for i in json_load(str(m.recently_finished_runs)) if i in runs]
+    return AgentDataSummary(
+        agent_name='/'.join(str(m.identifier).split('/')[1:]),
+        agent_rating=float(m.best_rating),
+        current_agent_rating=float(m.current_rating),
+        recent_runs=list(reversed(recent_runs)),
+        total_number_of_runs=int(m.total_runs),
+        fully_evaluated=bool(m.fully_evaluated),
+    )
+
+
+def get_agent_data_summaries_for_env(env_id: str, include_recent_runs: bool = True) -> list[AgentDataSummary]:
+    """ loads the summaries of all agents in the environment with two queries (one if runs are not included) """
+    with models.Session() as session:
+        agent_models = list(session.scalars(
+            sqlalchemy.select(models.AgentDataModel).where(models.AgentDataModel.environment == env_id)
+        ))
+        runs: dict[int, AbbreviatedRunData] = {}
+        if include_recent_runs:
+            runs = load_abbreviated_run_data(
+                (run_id for m in agent_models for run_id in json_load(str(m.recently_finished_runs))), session
+            )
+    return [_model_to_agent_data_summary(m, runs) for m in agent_models]
 
 
 def get_all_agentdata_for_env(env_id: str) -> list[AgentData]:
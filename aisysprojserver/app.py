@@ -5,16 +5,19 @@ from pathlib import Path
 from typing import Optional
 
 from flask import Flask, g, jsonify
-from werkzeug.exceptions import HTTPException, InternalServerError, Unauthorized
+from werkzeug.exceptions import HTTPException, InternalServerError, Unauthorized, ServiceUnavailable
 
 from aisysprojserver import models, agent_account_management, plugins, authentication, active_env_management, act, \
-    website, admin, group_management, telemetry
+    website, admin, group_management, telemetry, migrations, env_executor, run_pool, archive, render_cache
 from aisysprojserver.config import Config, TestConfig, UwsgiConfig
 from aisysprojserver.group import Group
 from aisysprojserver.plugins import PluginManager
 
 
 def exception_handler(exception):
+    if models.is_lock_error(exception):
+        # the server is busy - clients should retry later
+        exception = ServiceUnavailable('The server is busy, please try again', retry_after=1)
     if isinstance(exception, HTTPException):
         response = exception.get_response()
         if hasattr(g, 'isJSON') and g.isJSON:
@@ -71,11 +74,18 @@ def create_app(configuration: Optional[Config] = None) -> Flask:
         PluginManager.reload_all_plugins()
 
     models.setup(configuration)
+    migrations.migrate(models.engine)
+    env_executor.setup(configuration)
+    archive.setup(configuration.ARCHIVE_DIR)
+    render_cache.setup(configuration.RENDER_CACHE_FILE, configuration.RENDER_CACHE_MAX_SIZE)
     if not isinstance(configuration, UwsgiConfig):
         logging.info('Setting up telemetry')
         # uwsgi's pre-forking causes problems - it's setup in uwsgi_main.py
         # (see https://opentelemetry-python.readthedocs.io/en/latest/examples/fork-process-model/README.html)
         telemetry.setup(configuration)
+        # the background thread would not survive uwsgi's forking either
+        run_pool.setup(configuration.RUN_POOL_FILL_INTERVAL)
+        archive.start_background_archiving(configuration.ARCHIVE_INTERVAL)
 
     # data initialization - there must always be a main group
     if not Group('main').exists():
@@ -0,0 +1,264 @@
+""" Archive for finished runs that are no longer needed in the database.
+
+Finished runs (except for the recent ones, which are displayed on the website) are moved from the ``runs`` table
+into append-only segment files under ``Config.ARCHIVE_DIR`` (one directory per environment).
+Every segment file is a sequence of gzip members, each containing a batch of runs as JSON lines,
+so the files can be read with standard tools (e.g. ``zcat``) for later analysis.
+The ``archived_runs`` table is the index: it maps run identifiers to the gzip member that contains the run.
+
+Archiving happens in the background (every ``Config.ARCHIVE_INTERVAL`` seconds)
+or via the ``/removenonrecentruns`` admin endpoint.
+"""
+import base64
+import fcntl
+import gzip
+import itertools
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+import sqlalchemy
+
+from aisysprojserver import models
+from aisysprojserver.active_env import ActiveEnvironment
+from aisysprojserver.env_interface import ActionHistoryEntry, RunData
+from aisysprojserver.run import decode_state, delete_steps_of_runs
+from aisysprojserver.util import json_dump, json_load
+
+logger = logging.getLogger(__name__)
+
+_archive_dir: Optional[Path] = None
+
+# number of runs that are archived per batch (i.e. per gzip member)
+_BATCH_SIZE: int = 500
+# a new segment file is started once the current one is larger than this (in bytes)
+_SEGMENT_SIZE: int = 64 * 1024 * 1024
+
+
+def _get_env_dir(env_id: str) -> Path:
+    assert _archive_dir is not None, 'archive directory not set'
+    if env_id in {'.', '..'} or '/' in env_id:
+        raise ValueError(f'Cannot archive runs of environment {env_id!r}')
+    return _archive_dir / env_id
+
+
+def _run_to_record(run: models.RunModel, steps: list[tuple[str, str]]) -> dict[str, Any]:
+    """ ``steps`` are the JSON-encoded (action, extra info) pairs (ignored for legacy runs) """
+    if run.number_of_steps is None:     # legacy run
+        history = json_load(str(run.history))
+    else:
+        history = [[json_load(action), json_load(extra_info)] for action, extra_info in steps]
+    record: dict[str, Any] = {
+        'run': int(run.identifier),
+        'environment': run.environment,
+        'agent': run.agent,
+        'outcome': json_load(str(run.outcome)),
+        'history': history,
+    }
+    if run.state_blob is not None:
+        record['state_blob'] = base64.b64encode(run.state_blob).decode()
+    else:
+        record['state'] = json_load(str(run.state))
+    return record
+
+
+def _append_to_segment(env_id: str, records: list[dict[str, Any]]) -> tuple[str, int, int]:
+    """ appends the records as a gzip member and returns (segment, position, length) """
+    env_dir = _get_env_dir(env_id)
+    env_dir.mkdir(parents=True, exist_ok=True)
+    data = gzip.compress(b''.join(json_dump(record).encode() + b'\n' for record in records))
+
+    with open(env_dir / 'lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)    # other processes might archive concurrently
+        segments = sorted(env_dir.glob('*.jsonl.gz'))
+        if segments and segments[-1].stat().st_size < _SEGMENT_SIZE:
+            segment = segments[-1]
+        else:
+            segment = env_dir / f'{len(segments):06d}.jsonl.gz'
+        with open(segment, 'ab') as f:
+            position = f.seek(0, os.SEEK_END)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    return f'{env_id}/{segment.name}', position, len(data)
+
+
+def _archive_batch(env_id: str, after: int) -> tuple[int, Optional[int]]:
+    """ archives the finished non-recent runs of the next batch with identifiers > ``after``.
+    Returns the number of archived runs and the largest identifier of the batch (None if there are no more runs).
+
+    The runs are written to the segment file without holding the write lock (which would block all requests).
+    Afterwards, the write transaction only updates the index and deletes the runs
+    (runs that have been deleted or archived concurrently in the meantime remain in the segment without index entry).
+    """
+    with models.Session() as session:
+        runs: list[models.RunModel] = list(session.scalars(
+            sqlalchemy.select(models.RunModel).where(
+                models.RunModel.environment == env_id,
+                models.RunModel.finished == True,   # noqa: E712
+                models.RunModel.identifier > after,     # type: ignore
+            ).order_by(models.RunModel.identifier).limit(_BATCH_SIZE)
+        ))
+        if not runs:
+            return 0, None
+        last_id = int(runs[-1].identifier)
+
+        # the recent runs are still displayed (note: they are loaded after the runs,
+        # so runs that are finished concurrently are not archived)
+        keep: set[int] = set(json_load(models.KeyValAccess(session)[ActiveEnvironment(env_id).recent_runs_key] or '[]'))
+        for recent_runs in session.scalars(
+            sqlalchemy.select(models.AgentDataModel.recently_finished_runs)
+            .where(models.AgentDataModel.environment == env_id)
+        ):
+            keep.update(json_load(str(recent_runs)))
+        runs = [run for run in runs if int(run.identifier) not in keep]
+        if not runs:
+            return 0, last_id
+
+        run_ids = [int(run.identifier) for run in runs]
+        steps: dict[int, list[tuple[str, str]]] = {run_id: [] for run_id in run_ids}
+        for run_id, action, extra_info in session.execute(
+            sqlalchemy.select(models.RunStepModel.run, models.RunStepModel.action, models.RunStepModel.extra_info)
+            .where(models.RunStepModel.run.in_(run_ids))
+            .order_by(models.RunStepModel.run, models.RunStepModel.step)
+        ):
+            steps[run_id].append((action, extra_info))
+        records = [_run_to_record(run, steps[int(run.identifier)]) for run in runs]
+        agents = {int(run.identifier): str(run.agent) for run in runs}
+
+    segment, position, length = _append_to_segment(env_id, records)
+
+    with models.Session() as session:
+        models.begin_write_transaction(session)
+        # runs that have been archived (or deleted) concurrently are no longer in the database
+        run_ids = list(session.scalars(
+            sqlalchemy.select(models.RunModel.identifier)
+            .where(models.RunModel.identifier.in_(run_ids), models.RunModel.finished == True)   # noqa: E712
+            .with_for_update()
+        ))
+        if not run_ids:
+            return 0, last_id
+        session.add_all([
+            models.ArchivedRunModel(identifier=run_id, environment=env_id, agent=agents[run_id],
+                                    segment=segment, position=position, length=length)
+            for run_id in run_ids
+        ])
+        delete_steps_of_runs(run_ids, session)
+        session.execute(sqlalchemy.delete(models.RunModel).where(models.RunModel.identifier.in_(run_ids)))
+        session.commit()
+        return len(run_ids), last_id
+
+
+def archive_runs(env_id: str) -> int:
+    """ moves the finished non-recent runs of the environment into the archive (returns the number of runs) """
+    archived = 0
+    after = 0
+    while True:
+        number, last_id = _archive_batch(env_id, after)
+        if last_id is None:
+            return archived
+        archived += number
+        after = last_id
+
+
+def archive_all() -> int:
+    """ archives the runs of all environments (returns the number of runs) """
+    with models.Session() as session:
+        env_ids = list(session.scalars(sqlalchemy.select(models.ActiveEnvironmentModel.identifier)))
+    archived = 0
+    for env_id in env_ids:
+        try:
+            archived += archive_runs(env_id)
+        except Exception:
+            logger.exception(f'Failed to archive the runs of {env_id}')
+    return archived
+
+
+def _read_member(segment: str, position: int, length: int) -> list[bytes]:
+    """ returns the lines (i.e. runs) of a gzip member """
+    assert _archive_dir is not None, 'archive directory not set'
+    with open(_archive_dir / segment, 'rb') as f:
+        f.seek(position)
+        return gzip.decompress(f.read(length)).splitlines()
+
+
+def load_run(run_id: int) -> Optional[tuple[str, RunData]]:
+    """ loads an archived run (returns the environment identifier and the run data) """
+    with models.Session() as session:
+        entry: Optional[models.ArchivedRunModel] = session.get(models.ArchivedRunModel, run_id)
+    if entry is None:
+        return None
+    lines = _read_member(str(entry.segment), int(entry.position), int(entry.length))
+
+    prefix = f'{{"run":{run_id},'.encode()    # only the line of the run has to be parsed
+    line = next(line for line in lines if line.startswith(prefix))
+    record = json_load(line.decode())
+    if 'state_blob' in record:
+        state = decode_state(None, base64.b64decode(record['state_blob']))
+    else:
+        state = record['state']
+    return record['environment'], RunData(
+        action_history=[ActionHistoryEntry(action, extra_info) for action, extra_info in record['history']],
+        state=state,
+        outcome=record['outcome'],
+        agent_name='/'.join(record['agent'].split('/')[1:]),
+        run_id=run_id,
+    )
+
+
+def iter_archived_runs(env_id: str) -> Iterator[dict[str, Any]]:
+    """ yields the archived runs of the environment as records (see ``_run_to_record``).
+    Only one gzip member is kept in memory at a time. """
+    with models.Session() as session:
+        rows = session.execute(
+            sqlalchemy.select(models.ArchivedRunModel.identifier, models.ArchivedRunModel.segment,
+                              models.ArchivedRunModel.position, models.ArchivedRunModel.length)
+            .where(models.ArchivedRunModel.environment == env_id)
+            .order_by(models.ArchivedRunModel.segment, models.ArchivedRunModel.position)
+            .execution_options(yield_per=1000)
+        )
+        member: Optional[tuple[str, int, int]] = None
+        run_ids: set[int] = set()
+        for run_id, segment, position, length in itertools.chain(rows, [(None, None, None, None)]):
+            if (segment, position, length) != member:
+                if member is not None:
+                    # a member might contain runs without index entry (if archiving failed after writing it)
+                    for line in _read_member(*member):
+                        if (record := json_load(line.decode()))['run'] in run_ids:
+                            yield record
+                member = (segment, position, length)
+                run_ids = set()
+            run_ids.add(run_id)
+
+
+def get_archived_run_ids(run_ids: list[int]) -> set[int]:
+    """ the subset of ``run_ids`` that has been archived """
+    result: set[int] = set()
+    with models.Session() as session:
+        for i in range(0, len(run_ids), models.MAX_IN_PARAMETERS):
+            result.update(session.scalars(
+                sqlalchemy.select(models.ArchivedRunModel.identifier)
+                .where(models.ArchivedRunModel.identifier.in_(run_ids[i:i + models.MAX_IN_PARAMETERS]))
+            ))
+    return result
+
+
+def _archive_periodically(interval: float):
+    while True:
+        time.sleep(interval)
+        archive_all()
+
+
+def setup(archive_dir: Path):
+    global _archive_dir
+    _archive_dir = archive_dir
+
+
+def start_background_archiving(interval: Optional[float]):
+    """ archives runs every ``interval`` seconds in a background thread (unless ``interval`` is None) """
+    if interval is not None:
+        threading.Thread(target=_archive_periodically, args=(interval,), name='run-archiver', daemon=True).start()
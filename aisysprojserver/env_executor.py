@@ -0,0 +1,234 @@
+""" Execution of environment calls (``act``, ``new_run``, ``get_action_request`` and ``get_abandon_outcome``).
+
+By default, environments are called inline, i.e. in the server process.
+With ``Config.ENV_EXECUTOR = 'processes'``, the calls are dispatched to a pool of warm worker processes instead.
+Then a slow environment only blocks its worker (and not the server),
+and calls that take longer than ``Config.ENV_CALL_TIMEOUT`` are aborted by killing the worker.
+
+In both cases, the number of concurrent calls per environment can be limited
+(see ``Config.ENV_MAX_CONCURRENCY`` and ``EnvSettings.MAX_CONCURRENT_CALLS``).
+"""
+from __future__ import annotations
+
+import abc
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+from multiprocessing.connection import Connection
+from pathlib import Path
+from typing import Any, Optional
+
+from werkzeug.exceptions import ServiceUnavailable
+
+from aisysprojserver import telemetry
+from aisysprojserver.active_env import ActiveEnvironment
+from aisysprojserver.config import Config
+from aisysprojserver.env_interface import EnvInfo, GenericEnvironment
+from aisysprojserver.plugins import PluginManager
+from aisysprojserver.util import json_load
+
+logger = logging.getLogger(__name__)
+
+
+class EnvUnavailable(ServiceUnavailable):
+    """ The environment did not respond in time or is too busy """
+    def __init__(self, description: str):
+        ServiceUnavailable.__init__(self, description, retry_after=1)
+
+
+class EnvCallError(Exception):
+    """ Carries the traceback of an exception that was raised in a worker process """
+    pass
+
+
+class EnvExecutor(abc.ABC):
+    def __init__(self, max_concurrency: Optional[int], timeout: float):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._semaphores: dict[str, threading.BoundedSemaphore] = {}
+        self._semaphores_lock = threading.Lock()
+
+    def _get_semaphore(self, active_env: ActiveEnvironment, env: GenericEnvironment) -> Optional[threading.Semaphore]:
+        max_concurrency = env.settings.MAX_CONCURRENT_CALLS or self.max_concurrency
+        if max_concurrency is None:
+            return None
+        with self._semaphores_lock:
+            if active_env.identifier not in self._semaphores:
+                self._semaphores[active_env.identifier] = threading.BoundedSemaphore(max_concurrency)
+            return self._semaphores[active_env.identifier]
+
+    def call(self, active_env: ActiveEnvironment, method: str, *args) -> Any:
+        """ calls ``method`` of the environment instance (raises ``EnvUnavailable`` on timeouts) """
+        env_class = active_env.env_class_refstr
+        start = time.time()
+        semaphore = self._get_semaphore(active_env, active_env.get_env_instance())
+        if semaphore is not None and not semaphore.acquire(timeout=self.timeout):
+            telemetry.report_env_call(env_class, method, time.time() - start, None, 'busy')
+            raise EnvUnavailable('The environment is busy, please try again')
+        try:
+            return self._execute(active_env, method, args, start)
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+    @abc.abstractmethod
+    def _execute(self, active_env: ActiveEnvironment, method: str, args: tuple, start: float) -> Any:
+        """ ``start`` is the time when the call was requested (for measuring the queue wait) """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class InlineEnvExecutor(EnvExecutor):
+    """ calls the environment in the server process (timeouts cannot be enforced) """
+    def _execute(self, active_env: ActiveEnvironment, method: str, args: tuple, start: float) -> Any:
+        env = active_env.get_env_instance()
+        queue_wait = time.time() - start
+        outcome = 'error'
+        try:
+            result = getattr(env, method)(*args)
+            outcome = 'success'
+            return result
+        finally:
+            telemetry.report_env_call(active_env.env_class_refstr, method, queue_wait,
+                                      time.time() - start - queue_wait, outcome)
+
+
+def _worker_main(conn: Connection, plugins_dir: Path):
+    PluginManager.set_plugins_dir(plugins_dir)
+    PluginManager.reload_all_plugins()
+    # environment identifier -> (instance key, instance) - see ``ActiveEnvironment.get_env_instance``
+    env_instances: dict[str, tuple[tuple, GenericEnvironment]] = {}
+    conn.send('ready')
+
+    while True:
+        try:
+            identifier, instance_key, method, args = conn.recv()
+        except EOFError:    # server process has terminated
+            return
+        try:
+            if (cached := env_instances.get(identifier)) is None or cached[0] != instance_key:
+                env_class, config, display_name, _ = instance_key
+                env_instances[identifier] = (
+                    instance_key, PluginManager.get(env_class)(EnvInfo(display_name, identifier), json_load(config))
+                )
+            conn.send((True, getattr(env_instances[identifier][1], method)(*args)))
+        except Exception as e:
+            tb = traceback.format_exc()
+            try:
+                conn.send((False, e, tb))
+            except Exception:   # exception cannot be pickled
+                conn.send((False, EnvCallError(tb), tb))
+
+
+class _Worker:
+    def __init__(self, plugins_dir: Path):
+        # plugins get reloaded in the server process -> workers have to be restarted
+        self.plugin_generation: int = PluginManager.reload_counter
+        context = multiprocessing.get_context('spawn')   # forking would copy database connections etc.
+        self.conn, conn = context.Pipe(duplex=True)
+        self.process = context.Process(target=_worker_main, args=(conn, plugins_dir), daemon=True)
+        self.process.start()
+        conn.close()
+        assert self.conn.recv() == 'ready'
+
+    def send_call(self, active_env: ActiveEnvironment, method: str, args: tuple):
+        self.conn.send((active_env.identifier, active_env.instance_key, method, args))
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class ProcessPoolEnvExecutor(EnvExecutor):
+    """ calls the environment in a pool of worker processes (which are started on demand) """
+    def __init__(self, max_concurrency: Optional[int], timeout: float, number_of_workers: int, plugins_dir: Path):
+        EnvExecutor.__init__(self, max_concurrency, timeout)
+        self.plugins_dir = plugins_dir
+        # idle workers (None means that the worker has not been started yet)
+        self._workers: queue.Queue[Optional[_Worker]] = queue.Queue()
+        for _ in range(number_of_workers):
+            self._workers.put(None)
+
+    def _acquire_worker(self, timeout: float) -> _Worker:
+        try:
+            worker = self._workers.get(timeout=timeout)
+        except queue.Empty:
+            raise EnvUnavailable('The environment is busy, please try again')
+        try:
+            if worker is not None and worker.plugin_generation != PluginManager.reload_counter:
+                worker.kill()
+                worker = None
+            if worker is None:
+                worker = _Worker(self.plugins_dir)
+            return worker
+        except BaseException:
+            self._workers.put(None)
+            raise
+
+    def _execute(self, active_env: ActiveEnvironment, method: str, args: tuple, start: float) -> Any:
+        env_class = active_env.env_class_refstr
+        worker = self._acquire_worker(max(self.timeout - (time.time() - start), 0))
+        queue_wait = time.time() - start
+        try:
+            worker.send_call(active_env, method, args)
+            if not worker.conn.poll(self.timeout):
+                logger.warning(f'Call of {method} timed out for environment {active_env.identifier} - killing worker')
+                telemetry.report_env_call(env_class, method, queue_wait, time.time() - start - queue_wait, 'timeout')
+                worker.kill()
+                worker = None   # type: ignore
+                raise EnvUnavailable(f'The environment did not respond within {self.timeout} seconds')
+            success, *result = worker.conn.recv()
+        except EnvUnavailable:
+            raise
+        except BaseException:   # e.g. the worker crashed -> we cannot trust it anymore
+            if worker is not None:
+                worker.kill()
+                worker = None   # type: ignore
+            raise
+        finally:
+            self._workers.put(worker)
+
+        telemetry.report_env_call(env_class, method, queue_wait, time.time() - start - queue_wait,
+                                  'success' if success else 'error')
+        if not success:
+            exception, tb = result
+            raise exception from EnvCallError(tb)
+        return result[0]
+
+    def close(self):
+        while True:
+            try:
+                worker = self._workers.get_nowait()
+            except queue.Empty:
+                return
+            if worker is not None:
+                worker.kill()
+
+
+_executor: EnvExecutor = InlineEnvExecutor(None, 10)
+
+
+def get_executor() -> EnvExecutor:
+    return _executor
+
+
+def set_executor(executor: EnvExecutor):
+    global _executor
+    _executor.close()
+    _executor = executor
+
+
+def setup(config: Config):
+    if config.ENV_EXECUTOR == 'inline':
+        set_executor(InlineEnvExecutor(config.ENV_MAX_CONCURRENCY, config.ENV_CALL_TIMEOUT))
+    elif config.ENV_EXECUTOR == 'processes':
+        set_executor(ProcessPoolEnvExecutor(config.ENV_MAX_CONCURRENCY, config.ENV_CALL_TIMEOUT,
+                                            config.ENV_WORKER_PROCESSES, config.PLUGINS_DIR))
+    else:
+        raise ValueError(f'Unsupported ENV_EXECUTOR {config.ENV_EXECUTOR!r}')
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import abc
 import dataclasses
-from typing import Optional, Any
+from typing import Optional, Any, Sequence
 
 from werkzeug.exceptions import NotFound
 
@@ -34,7 +34,7 @@ class ActionHistoryEntry:
 
 @dataclasses.dataclass(frozen=True)
 class RunData:
-    action_history: list[ActionHistoryEntry]
+    action_history: Sequence[ActionHistoryEntry]    # loaded lazily by the server
     state: Any
     outcome: Optional[Any]
     run_id: int
@@ -96,6 +96,20 @@ class GenericEnvironment(abc.ABC):
     def get_abandon_outcome(self, run_data: RunData) -> Any:
         raise NotImplementedError()
 
+    # Batch versions of the methods above.
+    # They can be overridden to process several runs at once (e.g. in a single numpy pass).
+    # The default implementations call the methods for individual runs.
+
+    def act_batch(self, actions: list[tuple[Any, RunData]]) -> list[ActionResult]:
+        # actions for different runs - if not overridden, the server evaluates the actions concurrently instead
+        return [self.act(action, run_data) for action, run_data in actions]
+
+    def new_runs(self, number: int) -> list[Any]:     # returns the states of the new runs
+        return [self.new_run() for _ in range(number)]
+
+    def get_action_requests(self, run_data: list[RunData]) -> list[ActionRequest]:
+        return [self.get_action_request(rd) for rd in run_data]
+
     def view_run(self, run_data: RunData) -> str:
         raise NotFound('Viewing runs is not supported for this environment')
 
@@ -2,6 +2,7 @@
 
 Note that only the relevant subset of settings is actually used.
 """
+from typing import Optional
 
 
 class EnvSettings:
@@ -12,14 +13,21 @@ class EnvSettings:
     # Rating for new agents
     INITIAL_RATING: float = 0.0
 
-    # Strategy for computing the rating of an agent.
+    # Strategy for computing the rating of an agent (see ``rating.py``).
     # Possible values:
-    #     "average": Average of ``MIN_RUNS_FOR_FULLY_EVALUATED`` runs
+    #     "average": Average of the last ``MIN_RUNS_FOR_FULLY_EVALUATED`` runs
+    #     "median": Median of the last ``MIN_RUNS_FOR_FULLY_EVALUATED`` runs (robust against outliers)
+    #     "ema": Exponential moving average (with the smoothing of a ``MIN_RUNS_FOR_FULLY_EVALUATED``-run average)
+    #     "elo": Elo rating for playing against the environment (outcomes: 1 for a win, 0.5 for a draw, 0 for a loss)
     RATING_STRATEGY: str = 'average'
 
     # Number of runs required to accept the rating
     MIN_RUNS_FOR_FULLY_EVALUATED: int = 50
 
+    # Settings for the "elo" strategy (``INITIAL_RATING`` should usually be set to the opponent rating as well)
+    ELO_OPPONENT_RATING: float = 1500.0
+    ELO_K_FACTOR: float = 32.0
+
     # What kind of rating agents strive for.
     # Possible values:
     #     "max": Maximize the rating
@@ -35,7 +43,45 @@ class EnvSettings:
 
     CAN_ABANDON_RUNS: bool = False
 
-    STORE_ACTION_HISTORY: bool = True    # TODO: Implement not storing action history
+    # If False, the action history is not stored and ``RunData.action_history`` only contains
+    # the last ``ACTION_HISTORY_TAIL`` actions (i.e. the environment has to work with ``RunData.state``).
+    # This can save a lot of space and time for runs with many actions.
+    STORE_ACTION_HISTORY: bool = True
+
+    # Number of recent actions that are kept if ``STORE_ACTION_HISTORY`` is False (e.g. for viewing runs)
+    ACTION_HISTORY_TAIL: int = 0
+
+    # **************************
+    # * SETTINGS FOR EXECUTION *
+    # **************************
+
+    # Number of initial states of runs that are generated in the background and kept in stock (see ``run_pool.py``).
+    # Useful if ``new_run`` is slow (e.g. puzzle generation).
+    # The states are generated in advance, so ``new_run`` must not depend on the time etc.
+    RUN_POOL_SIZE: int = 0
+
+    # How the states of runs are stored.
+    # Possible values:
+    #     "json": JSON (the state must be JSON-serializable)
+    #     "msgpack": msgpack, which also supports bytes and numpy arrays (requires the msgpack package)
+    #     "numpy": a single numpy array (e.g. a board)
+    # Binary codecs are more compact and faster for large states.
+    STATE_CODEC: str = 'json'
+
+    # Encoded states that are larger than this (in bytes) are compressed (None disables compression).
+    STATE_COMPRESSION_THRESHOLD: Optional[int] = 4096
+
+    # If True, the actions of a request are evaluated concurrently (see ``Config.ACTION_EVALUATION_THREADS``).
+    # The environment instance is shared by the threads, so ``act`` must be thread-safe.
+    # This is only faster if ``act`` releases the GIL (e.g. numpy operations on large arrays).
+    # With the "processes" executor (``Config.ENV_EXECUTOR``), the actions are always evaluated concurrently
+    # because every call gets a worker process of its own.
+    CONCURRENT_ACTION_EVALUATION: bool = False
+
+    # Maximum number of concurrent calls of the environment per server process
+    # (None means that the server default ``Config.ENV_MAX_CONCURRENCY`` is used).
+    # Useful for CPU-heavy environments, which would otherwise occupy all workers.
+    MAX_CONCURRENT_CALLS: Optional[int] = None
 
     # ************************
     # * SETTINGS FOR DISPLAY *
@@ -0,0 +1,126 @@
+""" Migrations of the database schema.
+
+A new database is created directly from the models.
+An existing database is migrated step by step, starting from the schema version stored in the ``keyval`` table
+(databases without a stored version have the schema of version 0.1.3, before migrations were introduced).
+
+To change the schema, modify the models and append a migration to ``MIGRATIONS``.
+Migrations should work for all supported database backends (SQLite and PostgreSQL)
+and should tolerate changes that have already been applied.
+
+Migrations are applied automatically when the server starts.
+They can also be applied manually with ``python -m aisysprojserver.migrations <database URI>``.
+"""
+
+import logging
+import sys
+from typing import Callable, Optional
+
+from sqlalchemy import Column, Connection, Engine, Integer, LargeBinary, create_engine, inspect, select
+from sqlalchemy.orm import Session
+
+from aisysprojserver import models
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_KEY: str = '#schema-version'
+
+
+def _add_column(connection: Connection, table: str, column: Column):
+    if column.name in {c['name'] for c in inspect(connection).get_columns(table)}:
+        return
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {column.name} {column_type}')
+
+
+def _create_table(connection: Connection, table: str):
+    models.Base.metadata.tables[table].create(connection, checkfirst=True)
+
+
+def _create_index(connection: Connection, table: str, index: str):
+    next(i for i in models.Base.metadata.tables[table].indexes if i.name == index).create(connection, checkfirst=True)
+
+
+def _add_run_steps(connection: Connection):
+    """ append-only storage of action histories """
+    _add_column(connection, 'runs', Column('number_of_steps', Integer))
+    _create_table(connection, 'run_steps')
+
+
+def _add_run_pool(connection: Connection):
+    """ pre-generated initial states of runs """
+    _create_table(connection, 'run_pool')
+
+
+def _add_active_runs_index(connection: Connection):
+    """ composite index for finding the active runs of an agent """
+    _create_index(connection, 'runs', 'ix_runs_agent_finished_identifier')
+
+
+def _add_state_blobs(connection: Connection):
+    """ states of runs can be stored with other codecs than JSON """
+    _add_column(connection, 'runs', Column('state_blob', LargeBinary))
+    _add_column(connection, 'run_pool', Column('state_blob', LargeBinary))
+
+
+def _add_archived_runs(connection: Connection):
+    """ index of the runs that have been moved into the archive """
+    _create_table(connection, 'archived_runs')
+
+
+def _add_rating_states(connection: Connection):
+    """ compact rating states (the ``recent_results`` are converted lazily or with ``rating.py``) """
+    _add_column(connection, 'agents', Column('rating_state', LargeBinary))
+
+
+# MIGRATIONS[i] migrates from version i to version i + 1
+MIGRATIONS: list[Callable[[Connection], None]] = [
+    _add_run_steps,
+    _add_run_pool,
+    _add_active_runs_index,
+    _add_state_blobs,
+    _add_archived_runs,
+    _add_rating_states,
+]
+
+
+def get_schema_version(connection: Connection) -> Optional[int]:
+    """ None if the database has not been set up yet """
+    if not inspect(connection).has_table(models.KeyValModel.__tablename__):
+        return None
+    version = connection.execute(
+        select(models.KeyValModel.val).where(models.KeyValModel.key == SCHEMA_VERSION_KEY)
+    ).scalar()
+    return int(version) if version is not None else 0
+
+
+def _set_schema_version(connection: Connection, version: int):
+    with Session(bind=connection) as session:
+        models.KeyValAccess(session)[SCHEMA_VERSION_KEY] = str(version)
+        session.flush()
+
+
+def migrate(engine: Engine):
+    with engine.begin() as connection:
+        version = get_schema_version(connection)
+        if version is None:
+            logger.info('Creating new database')
+            models.Base.metadata.create_all(connection)
+            _set_schema_version(connection, len(MIGRATIONS))
+            return
+
+        for i in range(version, len(MIGRATIONS)):
+            logger.info(f'Migrating database from schema version {i} to {i + 1}')
+            MIGRATIONS[i](connection)
+            _set_schema_version(connection, i + 1)
+
+        # safety net for missing tables (e.g. if they were dropped manually)
+        models.Base.metadata.create_all(connection)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print(f'Usage: {sys.argv[0]} <database URI>')
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    migrate(create_engine(sys.argv[1]))
@@ -5,10 +5,14 @@ using only the most basic features.
 It is not a good example of how to structure a database model.
 """
 
+from pathlib import Path
 from typing import Generic, TypeVar, Optional, Callable, Any
 
-from sqlalchemy import Column, String, create_engine, Integer, Float, Boolean, Text, PrimaryKeyConstraint
+from sqlalchemy import Column, String, create_engine, Integer, Float, Boolean, Text, PrimaryKeyConstraint, event, \
+    Index, LargeBinary
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from werkzeug.exceptions import BadRequest
@@ -38,7 +42,8 @@ class AgentDataModel(Base):
 
     total_runs = Column(Integer)
     recently_finished_runs = Column(Text)
-    recent_results = Column(Text)  # necessary for computing the rating
+    recent_results = Column(Text)  # legacy: JSON (newer agents use ``rating_state`` instead)
+    rating_state = Column(LargeBinary)  # state for computing the rating (see ``rating.py``)
     best_rating = Column(Float)
     current_rating = Column(Float)
 
@@ -55,10 +60,56 @@ class RunModel(Base):
     # (used to make it harder for agents to delay bad runs to improve their rating)
     outstanding_action = Column(Boolean)
 
-    state = Column(Text)
-    history = Column(Text)
+    state = Column(Text)            # JSON (see ``run.encode_state``)
+    state_blob = Column(LargeBinary)    # state for codecs other than JSON (see ``EnvSettings.STATE_CODEC``)
+    history = Column(Text)      # legacy: JSON list of (action, extra info) - newer runs use ``RunStepModel`` instead
     outcome = Column(String)
 
+    number_of_steps = Column(Integer)   # None for legacy runs that still store their history in ``history``
+
+    __table_args__ = (
+        # for finding the active runs of an agent (see ``ActManager.get_act_response``)
+        Index('ix_runs_agent_finished_identifier', 'agent', 'finished', 'identifier'),
+    )
+
+
+class RunStepModel(Base):
+    """ A single action of a run (the action history is append-only) """
+    __tablename__ = 'run_steps'
+
+    run = Column(Integer)
+    step = Column(Integer)     # index in the action history
+
+    action = Column(Text)
+    extra_info = Column(Text)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('run', 'step', name='run_step_pk'),
+    )
+
+
+class PooledRunModel(Base):
+    """ A pre-generated initial state of a run that has not been claimed yet (see ``run_pool.py``) """
+    __tablename__ = 'run_pool'
+
+    identifier = Column(Integer, primary_key=True)
+    environment = Column(String, index=True)
+    state = Column(Text)
+    state_blob = Column(LargeBinary)
+
+
+class ArchivedRunModel(Base):
+    """ Index entry of a run that has been moved into the archive (see ``archive.py``) """
+    __tablename__ = 'archived_runs'
+
+    identifier = Column(Integer, primary_key=True)
+    environment = Column(String, index=True)
+    agent = Column(String, index=True)      # environment/agentname
+
+    segment = Column(String)        # path of the segment file (relative to ``Config.ARCHIVE_DIR``)
+    position = Column(Integer)      # byte offset of the gzip member that contains the run
+    length = Column(Integer)        # length of the gzip member in bytes
+
 
 class ActiveEnvironmentModel(Base):
     __tablename__ = 'active_environments'
@@ -106,14 +157,26 @@ class GroupEntryModel(Base):
 
 
 class KeyValAccess:
-    def __init__(self, session):
+    def __init__(self, session, for_update: bool = False):
         self.session = session
+        self.for_update = for_update    # lock entries that are read (for read-modify-write)
+
+    # dialects that support ``INSERT ... ON CONFLICT``
+    _upsert_dialects: dict[str, Callable[..., Any]] = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
 
     def __getitem__(self, item: str):
-        kv = self.session.get(KeyValModel, item)
+        # populate_existing: the entry might have been changed by ``__setitem__`` (which bypasses the session)
+        kv = self.session.get(KeyValModel, item, with_for_update=self.for_update, populate_existing=True)
         return kv.val if kv is not None else None
 
     def __setitem__(self, key, value):
+        # an upsert: if concurrent transactions create the same entry, the later one waits instead of failing
+        if (insert := self._upsert_dialects.get(self.session.get_bind().dialect.name)) is not None:
+            self.session.execute(
+                insert(KeyValModel).values(key=key, val=value)
+                .on_conflict_do_update(index_elements=[KeyValModel.key], set_={'val': value})
+            )
+            return
         entry = self.session.get(KeyValModel, key)
         if entry is not None:
             entry.val = value
@@ -159,12 +222,89 @@ class ModelMixin(Generic[_M]):
         self._model = None
 
 
+# databases limit the number of parameters per query, so large ``IN`` queries are split up
+MAX_IN_PARAMETERS: int = 5000
+
 engine: Engine = None  # type: ignore
 Session: sessionmaker = None  # type: ignore
 
 
+def _set_sqlite_pragmas(engine_: Engine, pragmas: dict[str, str | int]):
+    @event.listens_for(engine_, 'connect')
+    def do_connect(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+        cursor.close()
+
+
+def _fix_sqlite_transactions(engine_: Engine):
+    """ pysqlite does not emit BEGIN before a SAVEPOINT, which breaks nested transactions.
+    We therefore disable its transaction handling and emit BEGIN ourselves
+    (see https://docs.sqlalchemy.org/en/20/dialects/sqlite.html#serializable-isolation-savepoints-transactional-ddl).
+    """
+    @event.listens_for(engine_, 'connect')
+    def do_connect(dbapi_connection, _connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine_, 'begin')
+    def do_begin(connection):
+        if connection.get_execution_options().get('isolation_level') == 'AUTOCOMMIT':
+            return
+        if connection.get_execution_options().get('immediate'):
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+        else:
+            connection.exec_driver_sql('BEGIN')
+
+
+def begin_write_transaction(session, *rows_to_lock: tuple[type, Any]):
+    """ Begins a read-modify-write transaction that is serialized with concurrent ones.
+    Must be called before the session is used.
+
+    SQLite only has database-level locks, so we emit ``BEGIN IMMEDIATE``, which acquires the write lock right away
+    (otherwise, concurrent transactions can fail when they try to write after reading).
+    Other databases lock the specified rows (``SELECT ... FOR UPDATE``) instead.
+    """
+    if session.get_bind().dialect.name == 'sqlite':
+        session.connection(execution_options={'immediate': True})
+    else:
+        for model_class, identifier in rows_to_lock:
+            session.get(model_class, identifier, with_for_update=True)
+
+
+def is_lock_error(exception: Exception) -> bool:
+    """ True if the exception was caused by a lock that could not be acquired in time (or a deadlock) """
+    if not isinstance(exception, OperationalError):
+        return False
+    if 'database is locked' in str(exception.orig):   # SQLite
+        return True
+    # PostgreSQL: lock_not_available, deadlock_detected, serialization_failure
+    return getattr(exception.orig, 'pgcode', None) in {'55P03', '40P01', '40001'}
+
+
+def run_maintenance():
+    """ VACUUM and ANALYZE the database (cannot happen inside a transaction) """
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.exec_driver_sql('VACUUM')
+        connection.exec_driver_sql('ANALYZE')
+
+
+def get_database_size() -> Optional[int]:
+    """ in bytes (None if not supported for the database backend) """
+    if engine.dialect.name == 'sqlite' and engine.url.database:
+        path = Path(engine.url.database)
+        wal = path.with_name(path.name + '-wal')
+        return path.stat().st_size + (wal.stat().st_size if wal.exists() else 0)
+    if engine.dialect.name == 'postgresql':
+        with engine.connect() as connection:
+            return connection.exec_driver_sql('SELECT pg_database_size(current_database())').scalar()
+    return None
+
+
 def setup(config: Config):
     global engine, Session
-    engine = create_engine(config.DATABASE_URI)
-    Base.metadata.create_all(engine)
+    engine = create_engine(config.DATABASE_URI, **config.DATABASE_ENGINE_OPTIONS)
+    if engine.dialect.name == 'sqlite':
+        _fix_sqlite_transactions(engine)
+        _set_sqlite_pragmas(engine, config.SQLITE_PRAGMAS)
     Session = sessionmaker(engine, expire_on_commit=False)
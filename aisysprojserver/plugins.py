@@ -3,7 +3,7 @@ import io
 import logging
 import sys
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 from zipfile import ZipFile
 
 from flask import request, g, jsonify
@@ -51,6 +51,10 @@ class PluginManager:
     # It makes it a bit uglier, but isn't a problem because in practice.
     plugins_dir: Optional[Path] = None
     plugins: dict[str, Plugin] = {}
+    # incremented whenever plugins are reloaded (e.g. to invalidate caches)
+    reload_counter: int = 0
+    # called after a plugin was uploaded (e.g. to reload other worker processes)
+    upload_hooks: list[Callable[[], None]] = []
 
     @classmethod
     def set_plugins_dir(cls, plugins_dir: Path):
@@ -69,6 +73,7 @@ class PluginManager:
             for plugin in cls.plugins.values():
                 plugin.unimport()
             cls.plugins = {}
+        cls.reload_counter += 1
 
         assert cls.plugins_dir is not None, 'plugins_dir not set'
         for directory in cls.plugins_dir.iterdir():
@@ -126,4 +131,6 @@ def upload():
     data = request.get_data()
     with ZipFile(io.BytesIO(data)) as zf:
         PluginManager.load_from_zipfile(zf)
+    for hook in PluginManager.upload_hooks:
+        hook()
     return jsonify({'status': 'success'})
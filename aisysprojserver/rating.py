@@ -0,0 +1,280 @@
+""" Computation of agent ratings (see ``EnvSettings.RATING_STRATEGY``).
+
+Ratings are updated incrementally whenever an agent finishes a run.
+Every strategy keeps a small state per agent, so an update does not depend on the total number of runs of the agent.
+The state is stored in ``AgentDataModel.rating_state`` as a packed binary with a fixed size
+(e.g. an array of floats for the results in the rating window), prefixed with the name of the strategy.
+
+Agents from older versions store their recent results as JSON in ``AgentDataModel.recent_results`` instead.
+They are converted on their next finished run or with ``migrate_all_rating_states``.
+"""
+from __future__ import annotations
+
+import abc
+import bisect
+import logging
+import math
+import struct
+from typing import Any, Optional
+
+import sqlalchemy
+
+from aisysprojserver import models
+from aisysprojserver.active_env import ActiveEnvironment
+from aisysprojserver.env_settings import EnvSettings
+from aisysprojserver.util import json_load
+
+logger = logging.getLogger(__name__)
+
+
+class RatingStrategy(abc.ABC):
+    name: str
+
+    def __init__(self, settings: EnvSettings):
+        self.settings = settings
+
+    @abc.abstractmethod
+    def initial_state(self) -> dict[str, Any]:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def update(self, state: dict[str, Any], result: float) -> dict[str, Any]:
+        """ returns the state after adding the result of a run (``state`` can be modified) """
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_rating(self, state: dict[str, Any]) -> float:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def pack(self, state: dict[str, Any]) -> bytes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def unpack(self, data: bytes) -> dict[str, Any]:
+        raise NotImplementedError()
+
+    def from_results(self, results: list[float]) -> dict[str, Any]:
+        """ the state after the results (oldest first) """
+        state = self.initial_state()
+        for result in results:
+            state = self.update(state, result)
+        return state
+
+
+class _WindowedRating(RatingStrategy):
+    """ Rating based on the last ``MIN_RUNS_FOR_FULLY_EVALUATED`` results, which are kept in a ring buffer """
+
+    # fields of the state that are packed (as doubles) after the position in the ring buffer
+    _packed_fields: tuple[str, ...] = ()
+
+    @property
+    def size(self) -> int:
+        return self.settings.MIN_RUNS_FOR_FULLY_EVALUATED
+
+    def initial_state(self) -> dict[str, Any]:
+        return {'strategy': self.name, 'values': [], 'next': 0}
+
+    def update(self, state: dict[str, Any], result: float) -> dict[str, Any]:
+        values: list[float] = state['values']
+        position: int = state['next']
+        if len(values) > self.size or (len(values) < self.size and position != 0):  # the window size has changed
+            return self.from_results(values[position:] + values[:position] + [result])
+        evicted: Optional[float] = None
+        if len(values) < self.size:
+            values.append(result)
+        else:
+            evicted = values[position]
+            values[position] = result
+            state['next'] = (position + 1) % self.size
+        self._update_window(state, result, evicted)
+        return state
+
+    @abc.abstractmethod
+    def _update_window(self, state: dict[str, Any], added: float, evicted: Optional[float]):
+        """ updates the derived values of the state after ``added`` replaced ``evicted`` in the window """
+        raise NotImplementedError()
+
+    def _derive(self, state: dict[str, Any]):
+        """ computes the derived values that are not packed """
+        pass
+
+    def pack(self, state: dict[str, Any]) -> bytes:
+        fields = [state[field] for field in self._packed_fields]
+        return struct.pack(f'<I{len(fields) + len(state["values"])}d', state['next'], *fields, *state['values'])
+
+    def unpack(self, data: bytes) -> dict[str, Any]:
+        state = self.initial_state()
+        state['next'], *numbers = struct.unpack(f'<I{(len(data) - 4) // 8}d', data)
+        for field, value in zip(self._packed_fields, numbers):
+            state[field] = value
+        state['values'] = numbers[len(self._packed_fields):]
+        self._derive(state)
+        return state
+
+
+class AverageRating(_WindowedRating):
+    name = 'average'
+    _packed_fields = ('sum',)
+
+    def initial_state(self) -> dict[str, Any]:
+        return _WindowedRating.initial_state(self) | {'sum': 0.0}
+
+    def _update_window(self, state: dict[str, Any], added: float, evicted: Optional[float]):
+        if evicted is not None and state['next'] == 0:
+            # recompute the sum once per round to avoid accumulating rounding errors
+            state['sum'] = math.fsum(state['values'])
+        else:
+            state['sum'] += added - (evicted or 0.0)
+
+    def get_rating(self, state: dict[str, Any]) -> float:
+        return state['sum'] / len(state['values'])
+
+
+class MedianRating(_WindowedRating):
+    name = 'median'
+
+    def initial_state(self) -> dict[str, Any]:
+        return _WindowedRating.initial_state(self) | {'sorted': []}
+
+    def _update_window(self, state: dict[str, Any], added: float, evicted: Optional[float]):
+        ordered: list[float] = state['sorted']
+        if evicted is not None:
+            del ordered[bisect.bisect_left(ordered, evicted)]
+        bisect.insort(ordered, added)
+
+    def _derive(self, state: dict[str, Any]):
+        state['sorted'] = sorted(state['values'])
+
+    def get_rating(self, state: dict[str, Any]) -> float:
+        ordered = state['sorted']
+        middle = len(ordered) // 2
+        return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+class ExponentialMovingAverageRating(RatingStrategy):
+    """ the weight of older results decays exponentially (like an average of ``MIN_RUNS_FOR_FULLY_EVALUATED`` runs) """
+    name = 'ema'
+
+    def initial_state(self) -> dict[str, Any]:
+        return {'strategy': self.name, 'ema': None}
+
+    def update(self, state: dict[str, Any], result: float) -> dict[str, Any]:
+        if state['ema'] is None:
+            state['ema'] = result
+        else:
+            alpha = 2 / (self.settings.MIN_RUNS_FOR_FULLY_EVALUATED + 1)
+            state['ema'] += alpha * (result - state['ema'])
+        return state
+
+    def get_rating(self, state: dict[str, Any]) -> float:
+        return self.settings.INITIAL_RATING if state['ema'] is None else state['ema']
+
+    def pack(self, state: dict[str, Any]) -> bytes:
+        return struct.pack('<d', math.nan if state['ema'] is None else state['ema'])
+
+    def unpack(self, data: bytes) -> dict[str, Any]:
+        ema, = struct.unpack('<d', data)
+        return {'strategy': self.name, 'ema': None if math.isnan(ema) else ema}
+
+
+class EloRating(RatingStrategy):
+    """ Elo rating for environments in which the agent plays against the environment.
+    The result of a run has to be the score of the agent (1 for a win, 0.5 for a draw, 0 for a loss). """
+    name = 'elo'
+
+    def initial_state(self) -> dict[str, Any]:
+        return {'strategy': self.name, 'elo': self.settings.INITIAL_RATING}
+
+    def update(self, state: dict[str, Any], result: float) -> dict[str, Any]:
+        expected = 1 / (1 + 10 ** ((self.settings.ELO_OPPONENT_RATING - state['elo']) / 400))
+        state['elo'] += self.settings.ELO_K_FACTOR * (result - expected)
+        return state
+
+    def get_rating(self, state: dict[str, Any]) -> float:
+        return state['elo']
+
+    def pack(self, state: dict[str, Any]) -> bytes:
+        return struct.pack('<d', state['elo'])
+
+    def unpack(self, data: bytes) -> dict[str, Any]:
+        elo, = struct.unpack('<d', data)
+        return {'strategy': self.name, 'elo': elo}
+
+
+RATING_STRATEGIES: dict[str, type[RatingStrategy]] = {
+    'average': AverageRating,
+    'median': MedianRating,
+    'ema': ExponentialMovingAverageRating,
+    'elo': EloRating,
+}
+
+
+def get_rating_strategy(settings: EnvSettings) -> RatingStrategy:
+    if settings.RATING_STRATEGY not in RATING_STRATEGIES:
+        raise Exception(f'Unsupported RATING_STRATEGY {settings.RATING_STRATEGY}')
+    return RATING_STRATEGIES[settings.RATING_STRATEGY](settings)
+
+
+def _convert_state(strategy: RatingStrategy, state: dict[str, Any]) -> dict[str, Any]:
+    """ converts the state of another strategy (i.e. the strategy of the environment has changed) """
+    if 'values' in state:   # the results of windowed strategies can be re-used
+        return strategy.from_results(list(state['values'][state['next']:]) + list(state['values'][:state['next']]))
+    return strategy.initial_state()
+
+
+def _load_legacy_state(strategy: RatingStrategy, stored: str) -> dict[str, Any]:
+    state = json_load(stored)
+    if isinstance(state, list):     # list of recent results
+        return strategy.from_results(state)
+    return state if state.get('strategy') == strategy.name else _convert_state(strategy, state)
+
+
+def decode_state(strategy: RatingStrategy, rating_state: Optional[bytes],
+                 recent_results: Optional[str]) -> dict[str, Any]:
+    """ loads the state from the ``rating_state`` column (or the legacy ``recent_results`` column) """
+    if rating_state is None:
+        return _load_legacy_state(strategy, recent_results or '[]')
+    name_bytes, _, data = bytes(rating_state).partition(b'\0')
+    name = name_bytes.decode()
+    if name == strategy.name:
+        return strategy.unpack(data)
+    if name in RATING_STRATEGIES:
+        return _convert_state(strategy, RATING_STRATEGIES[name](strategy.settings).unpack(data))
+    return strategy.initial_state()
+
+
+def encode_state(strategy: RatingStrategy, state: dict[str, Any]) -> bytes:
+    """ the value for the ``rating_state`` column """
+    return strategy.name.encode() + b'\0' + strategy.pack(state)
+
+
+def migrate_all_rating_states(batch_size: int = 1000) -> int:
+    """ Converts the legacy ``recent_results`` of all agents. Returns the number of migrated agents. """
+    counter = 0
+    with models.Session() as session:
+        env_ids = list(session.scalars(sqlalchemy.select(models.ActiveEnvironmentModel.identifier)))
+    for env_id in env_ids:
+        try:
+            strategy = get_rating_strategy(ActiveEnvironment(env_id).get_env_instance().settings)
+        except Exception:
+            logger.exception(f'Cannot migrate the rating states of {env_id}')
+            continue
+        while True:
+            with models.Session() as session:
+                models.begin_write_transaction(session)     # concurrent runs might update the states as well
+                agents = list(session.scalars(
+                    sqlalchemy.select(models.AgentDataModel).where(
+                        models.AgentDataModel.environment == env_id,
+                        models.AgentDataModel.recent_results != None,   # noqa: E711
+                    ).limit(batch_size).with_for_update()
+                ))
+                if not agents:
+                    break
+                for agent in agents:
+                    state = decode_state(strategy, agent.rating_state, agent.recent_results)
+                    agent.rating_state = encode_state(strategy, state)
+                    agent.recent_results = None
+                session.commit()
+                counter += len(agents)
+    return counter
@@ -0,0 +1,85 @@
+""" Cache for the rendered HTML of run, agent and environment pages.
+
+Rendering these pages can be expensive (e.g. plugins might render complex visualizations in ``view_run``).
+The rendered pages are stored in an SQLite database (``Config.RENDER_CACHE_FILE``, see ``shared_cache.py``),
+so they survive restarts and are shared by all server processes.
+
+Instead of expiring after a timeout, every page has a content version and a cached page is only used
+if its version is current:
+finished runs never change (version 0),
+agent and environment pages change when a run is finished (version: ``ActiveEnvironment.get_content_version``).
+Pages are also stored with the server version, as the templates might change with it.
+Note that the number of runs of an agent would not be a suitable version for agent pages,
+as it is the same for an agent that has been deleted and re-created with the same number of runs.
+The version has to be determined before the data for rendering is loaded,
+as the page might otherwise be stored with a newer version than the data it shows.
+
+Only one version of a page is stored (and rarely viewed pages are evicted if the cache gets too large).
+The pages of an environment are removed when it is re-created, and all pages when a plugin is uploaded.
+"""
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+from aisysprojserver import __version__, telemetry
+from aisysprojserver.plugins import PluginManager
+from aisysprojserver.shared_cache import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+_store: Optional[SQLiteStore] = None
+
+
+def _get_full_version(version: int) -> str:
+    return f'{__version__}/{version}'
+
+
+def get(env_id: str, page: str, version: int) -> Optional[str]:
+    """ returns the cached page if it has the given version """
+    if _store is None:
+        return None
+    html: Optional[str] = None
+    try:
+        value = _store.get(f'{env_id}/{page}')
+    except sqlite3.Error:
+        logger.exception('Failed to read from the render cache')
+        value = None
+    if value is not None:
+        stored_version, _, stored_html = value.decode().partition('\n')
+        if stored_version == _get_full_version(version):
+            html = stored_html
+    telemetry.report_render_cache(page.split('/')[0], html is not None)
+    return html
+
+
+def put(env_id: str, page: str, version: int, html: str):
+    """ stores the page (replacing other versions).
+
+    It is fine if a concurrent request replaces a newer version with an older one:
+    the next request will not find the current version and render the page again.
+    """
+    if _store is None:
+        return
+    try:
+        _store.set(f'{env_id}/{page}', f'{_get_full_version(version)}\n{html}'.encode())
+    except sqlite3.Error:   # e.g. the database is locked - the page simply is not cached
+        logger.warning('Failed to write to the render cache', exc_info=True)
+
+
+def clear(env_id: Optional[str] = None):
+    """ removes the pages of the environment (or all pages if ``env_id`` is None) """
+    if _store is None:
+        return
+    if env_id is None:
+        _store.clear()
+    else:
+        _store.delete_prefix(f'{env_id}/')
+
+
+def setup(path: Path, max_size: int):
+    """ ``path`` is the SQLite database file, ``max_size`` is in bytes (0 disables the cache) """
+    global _store
+    _store = SQLiteStore(path, max_size) if max_size > 0 else None
+    if clear not in PluginManager.upload_hooks:
+        PluginManager.upload_hooks.insert(0, clear)    # the pages might look different with the new plugin version
@@ -1,10 +1,236 @@
 from __future__ import annotations
 
-from typing import Any
+import zlib
+from typing import Any, Callable, Iterable, Iterator, Optional, Sequence
+
+import sqlalchemy
 
 from aisysprojserver import models
 from aisysprojserver.env_interface import AbbreviatedRunData, RunData, ActionHistoryEntry
-from aisysprojserver.util import json_load
+from aisysprojserver.env_settings import EnvSettings
+from aisysprojserver.util import json_load, json_dump, get_state_codec
+
+
+class LazyActionHistory(Sequence[ActionHistoryEntry]):
+    """ Action history that is only loaded from the database when it is actually accessed.
+
+    Many environments only need the state, so this saves us from loading and parsing the history for every action.
+    """
+    def __init__(self, length: int, loader: Callable[[], list[ActionHistoryEntry]]):
+        self._length = length
+        self._loader = loader
+        self._entries: Optional[list[ActionHistoryEntry]] = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._entries is not None
+
+    def _load(self) -> list[ActionHistoryEntry]:
+        if self._entries is None:
+            self._entries = self._loader()
+        return self._entries
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index):
+        return self._load()[index]
+
+    def __iter__(self) -> Iterator[ActionHistoryEntry]:
+        return iter(self._load())
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (LazyActionHistory, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __reduce__(self):
+        # pickled as a list (e.g. when sent to a worker process, see ``env_executor``)
+        return list, (list(self),)
+
+    def __repr__(self) -> str:
+        return f'LazyActionHistory({self._load()!r})'
+
+
+def encode_state(state: Any, codec: str = 'json',
+                 compression_threshold: Optional[int] = None) -> tuple[Optional[str], Optional[bytes]]:
+    """ returns the values for the ``state`` and ``state_blob`` columns.
+    JSON is stored as text, other codecs in the BLOB column (prefixed with the name of the codec).
+    Encoded states that are larger than ``compression_threshold`` bytes are compressed
+    and stored in the BLOB column as well (the codec name gets the prefix ``zlib+``). """
+    text: Optional[str] = None
+    if codec == 'json':
+        text = json_dump(state)
+        data = text.encode()
+    else:
+        data = get_state_codec(codec).encode(state)
+
+    if compression_threshold is not None and len(data) > compression_threshold:
+        compressed = zlib.compress(data)
+        if len(compressed) < len(data):
+            return None, f'zlib+{codec}'.encode() + b'\0' + compressed
+
+    if text is not None:
+        return text, None
+    return None, codec.encode() + b'\0' + data
+
+
+def decode_state(state: Optional[str], state_blob: Optional[bytes]) -> Any:
+    """ the inverse of ``encode_state`` """
+    if state_blob is None:
+        return json_load(str(state))
+    codec_bytes, _, data = bytes(state_blob).partition(b'\0')
+    codec = codec_bytes.decode()
+    if codec.startswith('zlib+'):
+        codec = codec[len('zlib+'):]
+        data = zlib.decompress(data)
+    return get_state_codec(codec).decode(data)
+
+
+def sample_state_compression(session, sample_size: int = 100) -> tuple[int, int]:
+    """ returns the compressed and the original size (in bytes) of the compressed states
+    among the ``sample_size`` most recently created runs (an estimate for the compression ratio of the database) """
+    compressed_size = original_size = 0
+    for state_blob, in session.execute(
+        sqlalchemy.select(models.RunModel.state_blob).order_by(models.RunModel.identifier.desc()).limit(sample_size)
+    ):
+        if state_blob is None:
+            continue
+        codec, _, data = bytes(state_blob).partition(b'\0')
+        if codec.startswith(b'zlib+'):
+            compressed_size += len(data)
+            original_size += len(zlib.decompress(data))
+    return compressed_size, original_size
+
+
+def get_number_of_steps(run_model: models.RunModel) -> int:
+    if run_model.number_of_steps is None:   # legacy run
+        return len(json_load(str(run_model.history)))
+    return int(run_model.number_of_steps)
+
+
+def load_action_history(session, run_id: int, first_step: int = 0) -> list[ActionHistoryEntry]:
+    """ loads the stored steps from ``first_step`` on (older steps might still be stored if the history limit
+    was lowered, see ``append_action``). If ``session`` is None, a new session is used. """
+    if session is None:
+        with models.Session() as new_session:
+            return load_action_history(new_session, run_id, first_step)
+    rows = session.execute(
+        sqlalchemy.select(models.RunStepModel.action, models.RunStepModel.extra_info)
+        .where(models.RunStepModel.run == run_id, models.RunStepModel.step >= first_step)    # type: ignore
+        .order_by(models.RunStepModel.step)
+    )
+    return [ActionHistoryEntry(json_load(action), json_load(extra_info)) for action, extra_info in rows]
+
+
+def get_history_limit(settings: EnvSettings) -> Optional[int]:
+    """ The number of actions that are stored per run (None means that the full history is stored) """
+    if settings.STORE_ACTION_HISTORY:
+        return None
+    return settings.ACTION_HISTORY_TAIL
+
+
+def get_action_history(run_model: models.RunModel, session,
+                       history_limit: Optional[int] = None) -> Sequence[ActionHistoryEntry]:
+    """ The history is loaded lazily with ``session``
+    (which can be None if it is accessed from a different thread, see ``load_action_history``). """
+    if run_model.number_of_steps is None:   # legacy run
+        history = [ActionHistoryEntry(action, extra) for action, extra in json_load(str(run_model.history))]
+        return history if history_limit is None else history[max(len(history) - history_limit, 0):]
+    run_id = int(run_model.identifier)
+    number_of_steps = int(run_model.number_of_steps)
+    length = number_of_steps if history_limit is None else min(number_of_steps, history_limit)
+    if not length:
+        return []
+    return LazyActionHistory(length, lambda: load_action_history(session, run_id, number_of_steps - length))
+
+
+def extend_action_history(history: Sequence[ActionHistoryEntry], entry: ActionHistoryEntry, number_of_steps: int,
+                          run_id: int, history_limit: Optional[int] = None) -> Sequence[ActionHistoryEntry]:
+    """ The history after ``entry`` has been appended (see ``append_action``) - without loading it from the database
+    unless it has already been loaded. ``number_of_steps`` is the new number of steps. """
+    if isinstance(history, LazyActionHistory) and not history.is_loaded:
+        length = number_of_steps if history_limit is None else min(number_of_steps, history_limit)
+        if not length:
+            return []
+        return LazyActionHistory(length, lambda: load_action_history(None, run_id, number_of_steps - length))
+    entries = list(history) + [entry]
+    return entries if history_limit is None else entries[max(len(entries) - history_limit, 0):]
+
+
+def append_action(run_model: models.RunModel, action: Any, extra_info: Any, session,
+                  history_limit: Optional[int] = None):
+    """ Appends an action to the history of the run (only writes the new step).
+    If ``history_limit`` is not None, only the last ``history_limit`` actions are kept. """
+    was_legacy = run_model.number_of_steps is None
+    migrate_legacy_history(run_model, session)
+    if history_limit == 0:      # nothing is stored (and therefore nothing has to be deleted)
+        run_model.number_of_steps += 1   # type: ignore
+        return
+    session.add(models.RunStepModel(
+        run=run_model.identifier,
+        step=run_model.number_of_steps,
+        action=json_dump(action),
+        extra_info=json_dump(extra_info),
+    ))
+    run_model.number_of_steps += 1   # type: ignore
+    if history_limit is not None and run_model.number_of_steps > history_limit:
+        if was_legacy:  # the migrated history might be longer than the limit
+            condition = models.RunStepModel.step < run_model.number_of_steps - history_limit
+        else:   # only the step that falls out of the window has to be deleted
+            condition = models.RunStepModel.step == run_model.number_of_steps - history_limit - 1
+        session.execute(sqlalchemy.delete(models.RunStepModel).where(
+            models.RunStepModel.run == run_model.identifier, condition
+        ))
+
+
+def migrate_legacy_history(run_model: models.RunModel, session):
+    """ Moves the history of a legacy run from the ``history`` column to the ``run_steps`` table """
+    if run_model.number_of_steps is not None:
+        return
+    history = json_load(str(run_model.history))
+    session.add_all([
+        models.RunStepModel(run=run_model.identifier, step=i, action=json_dump(action), extra_info=json_dump(extra))
+        for i, (action, extra) in enumerate(history)
+    ])
+    run_model.number_of_steps = len(history)     # type: ignore
+    run_model.history = None    # type: ignore
+
+
+def migrate_all_legacy_histories(batch_size: int = 1000) -> int:
+    """ Migrates the histories of all legacy runs. Returns the number of migrated runs. """
+    counter = 0
+    while True:
+        with models.Session() as session:
+            query = sqlalchemy.select(models.RunModel).where(
+                models.RunModel.number_of_steps == None  # noqa: E711
+            ).limit(batch_size)
+            run_models = list(session.scalars(query))
+            if not run_models:
+                return counter
+            for run_model in run_models:
+                migrate_legacy_history(run_model, session)
+            session.commit()
+            counter += len(run_models)
+
+
+def load_abbreviated_run_data(run_ids: Iterable[int], session) -> dict[int, AbbreviatedRunData]:
+    """ loads the abbreviated data of many runs at once (missing runs are skipped) """
+    run_ids = list(set(run_ids))
+    result: dict[int, AbbreviatedRunData] = {}
+    for i in range(0, len(run_ids), models.MAX_IN_PARAMETERS):
+        rows = session.execute(
+            sqlalchemy.select(models.RunModel.identifier, models.RunModel.outcome, models.RunModel.agent)
+            .where(models.RunModel.identifier.in_(run_ids[i:i + models.MAX_IN_PARAMETERS]))
+        )
+        for identifier, outcome, agent in rows:
+            result[identifier] = AbbreviatedRunData(run_id=identifier, outcome=json_load(outcome), agent_name=agent)
+    return result
+
+
+def delete_steps_of_runs(run_ids, session):
+    """ ``run_ids`` can also be a subquery """
+    session.execute(sqlalchemy.delete(models.RunStepModel).where(models.RunStepModel.run.in_(run_ids)))
 
 
 class Run(models.ModelMixin[models.RunModel]):
@@ -14,11 +240,15 @@ class Run(models.ModelMixin[models.RunModel]):
         models.ModelMixin.__init__(self, models.RunModel)
         self.identifier = identifier
 
-    def get_history(self) -> list[str]:
-        return json_load(str(self._require_model().history))
+    def get_history(self) -> list[ActionHistoryEntry]:
+        """ returns the stored action history (which might be truncated, see ``EnvSettings.STORE_ACTION_HISTORY``) """
+        model = self._require_model()
+        if model.number_of_steps is None:   # legacy run
+            return list(get_action_history(model, None))
+        return load_action_history(None, int(model.identifier))
 
     def get_state(self) -> Any:
-        return json_load(str(self._require_model().state))
+        return decode_state(self._require_model().state, self._require_model().state_blob)   # type: ignore
 
     def to_abbreviated_run_data(self) -> AbbreviatedRunData:
         return AbbreviatedRunData(
@@ -28,10 +258,9 @@ class Run(models.ModelMixin[models.RunModel]):
         )
 
     def to_run_data(self) -> RunData:
-        history = json_load(str(self._require_model().history))
         return RunData(
-            action_history=[ActionHistoryEntry(action, extra) for action, extra in history],
-            state=json_load(str(self._require_model().state)),
+            action_history=self.get_history(),
+            state=self.get_state(),
             outcome=json_load(str(self._require_model().outcome)),
             agent_name='/'.join(self._require_model().agent.split('/')[1:]),
             run_id=self.identifier,
@@ -40,6 +269,9 @@ class Run(models.ModelMixin[models.RunModel]):
     def env_str(self) -> str:
         return str(self._require_model().environment)
 
+    def is_finished(self) -> bool:
+        return bool(self._require_model().finished)
+
 
 if __name__ == '__main__':
     raise Exception('This module is not the entry point for the server - use app.py or uwsgi_main.py instead')
@@ -0,0 +1,116 @@
+""" Pools of pre-generated initial states of runs.
+
+Creating runs can be slow for some environments (e.g. if puzzles have to be generated).
+For environments with ``EnvSettings.RUN_POOL_SIZE > 0``, initial states are therefore generated in the background
+and stored in the database, from where requests claim them.
+If a pool is empty, the states are generated on demand as usual.
+
+The pool of an environment is cleared when the environment is re-created or when a plugin is uploaded.
+"""
+import logging
+import threading
+import time
+from typing import Optional
+
+import sqlalchemy
+
+from aisysprojserver import models, env_executor, telemetry
+from aisysprojserver.active_env import ActiveEnvironment, get_all_active_envs
+from aisysprojserver.plugins import PluginManager
+from aisysprojserver.run import encode_state
+
+logger = logging.getLogger(__name__)
+
+# states are generated in batches of at most this size (to keep individual environment calls short)
+_FILL_BATCH_SIZE: int = 10
+
+
+def claim_states(session, env_id: str, number: int) -> list[tuple[Optional[str], Optional[bytes]]]:
+    """ removes up to ``number`` states from the pool and returns them (in the order they were generated).
+    The states are returned as stored (values for the ``state`` and ``state_blob`` columns, see ``encode_state``),
+    so they can be copied into new runs without serializing them again. """
+    rows = list(session.execute(
+        sqlalchemy.select(
+            models.PooledRunModel.identifier, models.PooledRunModel.state, models.PooledRunModel.state_blob
+        )
+        .where(models.PooledRunModel.environment == env_id)
+        .order_by(models.PooledRunModel.identifier)
+        .limit(number)
+        .with_for_update(skip_locked=True)   # concurrent requests (of other agents) claim other states
+    ))
+    if rows:
+        session.execute(sqlalchemy.delete(models.PooledRunModel).where(
+            models.PooledRunModel.identifier.in_([identifier for identifier, _, _ in rows])
+        ))
+    return [(state, state_blob) for _, state, state_blob in rows]
+
+
+def get_pool_size(session, env_id: str) -> int:
+    return session.scalar(
+        sqlalchemy.select(sqlalchemy.func.count())
+        .select_from(models.PooledRunModel)
+        .where(models.PooledRunModel.environment == env_id)
+    )
+
+
+def clear(env_id: Optional[str] = None):
+    """ clears the pool of the environment (or all pools if ``env_id`` is None) """
+    with models.Session() as session:
+        query = sqlalchemy.delete(models.PooledRunModel)
+        if env_id is not None:
+            query = query.where(models.PooledRunModel.environment == env_id)
+        session.execute(query)
+        session.commit()
+
+
+def fill(active_env: ActiveEnvironment) -> int:
+    """ generates the missing states of the pool (returns the number of generated states) """
+    settings = active_env.get_env_instance().settings
+    target = settings.RUN_POOL_SIZE
+    with models.Session() as session:
+        missing = target - get_pool_size(session, active_env.identifier)
+
+    generated = 0
+    while generated < missing:
+        with telemetry.measure_run_creation_duration(active_env.env_class_refstr):
+            states = env_executor.get_executor().call(
+                active_env, 'new_runs', min(missing - generated, _FILL_BATCH_SIZE)
+            )
+        if not states:     # otherwise, we would ask for new states forever
+            logger.warning(f'The environment {active_env.identifier} did not return any states for its run pool')
+            break
+        with models.Session() as session:
+            for state in states:
+                state_text, state_blob = encode_state(state, settings.STATE_CODEC, settings.STATE_COMPRESSION_THRESHOLD)
+                session.add(models.PooledRunModel(
+                    environment=active_env.identifier, state=state_text, state_blob=state_blob
+                ))
+            session.commit()
+        generated += len(states)
+    return generated
+
+
+def fill_all() -> int:
+    """ fills the pools of all environments (returns the number of generated states) """
+    generated = 0
+    for active_env in get_all_active_envs():
+        try:
+            generated += fill(active_env)
+        except Exception:
+            logger.exception(f'Failed to fill the run pool of {active_env.identifier}')
+    return generated
+
+
+def _fill_periodically(interval: float):
+    while True:
+        time.sleep(interval)
+        fill_all()
+
+
+def setup(interval: Optional[float]):
+    """ fills the pools every ``interval`` seconds in a background thread (unless ``interval`` is None) """
+    if clear not in PluginManager.upload_hooks:
+        # the states might have been generated with the old version of the plugin
+        PluginManager.upload_hooks.insert(0, clear)
+    if interval is not None:
+        threading.Thread(target=_fill_periodically, args=(interval,), name='run-pool-filler', daemon=True).start()
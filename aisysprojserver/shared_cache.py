@@ -0,0 +1,172 @@
+""" Caches that are shared by all server processes (without an external service like memcached or Redis).
+
+The entries are stored in an SQLite database.
+If the database grows larger than its size limit, the least recently used entries are evicted.
+``SQLiteCache`` is a flask_caching backend based on it
+(``Config.CACHE_TYPE = 'aisysprojserver.shared_cache.SQLiteCache'``) and ``render_cache.py`` uses it directly.
+
+Caches are best-effort: if the database is locked for too long, callers should treat it as a cache miss.
+"""
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Optional
+
+from flask import Flask
+from flask_caching.backends.base import BaseCache     # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStore:
+    """ Maps strings to bytes (entries can have an expiration time) """
+
+    # access times are only updated if they are older than this (in seconds) - otherwise every read would be a write
+    ACCESS_TIME_RESOLUTION: float = 10
+    # the size limit is enforced every ... writes (of this process)
+    EVICTION_INTERVAL: int = 100
+
+    def __init__(self, path: Path, max_size: int):
+        """ ``max_size`` is the approximate size limit in bytes (only keys and values are counted) """
+        self.path = path
+        self.max_size = max_size
+        self._local = threading.local()
+        self._writes = 0
+
+    def _get_connection(self) -> sqlite3.Connection:
+        # connections must not be shared between threads or (forked) processes
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')     # losing the last entries after a crash is acceptable
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                'size INTEGER NOT NULL, expires REAL, accessed REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_entries_accessed ON entries (accessed)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        row = self._get_connection().execute(
+            'SELECT value, expires, accessed FROM entries WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires, accessed = row
+        if expires is not None and expires <= now:
+            return None
+        if accessed < now - self.ACCESS_TIME_RESOLUTION:
+            self._get_connection().execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+        return value
+
+    def set(self, key: str, value: bytes, timeout: Optional[float] = None, only_if_missing: bool = False) -> bool:
+        """ ``timeout`` is in seconds (None means that the entry does not expire).
+        With ``only_if_missing``, existing (unexpired) entries are not replaced.
+        Returns True iff the entry was stored. """
+        now = time.time()
+        query = (
+            'INSERT INTO entries VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+            'value = excluded.value, size = excluded.size, expires = excluded.expires, accessed = excluded.accessed'
+        )
+        parameters: tuple = (key, value, len(key) + len(value), now + timeout if timeout is not None else None, now)
+        if only_if_missing:
+            query += ' WHERE entries.expires <= ?'
+            parameters += (now,)
+        stored = self._get_connection().execute(query, parameters).rowcount == 1
+
+        self._writes += 1
+        if self._writes % self.EVICTION_INTERVAL == 0:
+            try:
+                self.evict()
+            except sqlite3.Error:   # will be tried again later
+                logger.warning('Failed to evict cache entries', exc_info=True)
+        return stored
+
+    def has(self, key: str) -> bool:
+        return self._get_connection().execute(
+            'SELECT 1 FROM entries WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, time.time())
+        ).fetchone() is not None
+
+    def delete(self, key: str) -> bool:
+        return self._get_connection().execute('DELETE FROM entries WHERE key = ?', (key,)).rowcount == 1
+
+    def delete_prefix(self, prefix: str):
+        self._get_connection().execute('DELETE FROM entries WHERE substr(key, 1, ?) = ?', (len(prefix), prefix))
+
+    def clear(self):
+        self._get_connection().execute('DELETE FROM entries')
+
+    def evict(self):
+        """ removes the expired entries and the least recently used entries that exceed the size limit """
+        connection = self._get_connection()
+        connection.execute('DELETE FROM entries WHERE expires <= ?', (time.time(),))
+        connection.execute(
+            'DELETE FROM entries WHERE key IN ('
+            'SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed DESC, key) AS total FROM entries) '
+            'WHERE total > ?)',
+            (self.max_size,)
+        )
+
+
+class SQLiteCache(BaseCache):
+    """ flask_caching backend (configured with ``Config.CACHE_SQLITE_FILE`` and ``Config.CACHE_SQLITE_MAX_SIZE``) """
+
+    def __init__(self, path: Path, max_size: int, default_timeout: int = 300, ignore_delete_many_errors: bool = False):
+        BaseCache.__init__(self, default_timeout, ignore_delete_many_errors)
+        self.store = SQLiteStore(path, max_size)
+
+    @classmethod
+    def factory(cls, app: Flask, config: dict[str, Any], args: list[Any], kwargs: dict[str, Any]) -> 'SQLiteCache':
+        return cls(config['CACHE_SQLITE_FILE'], config['CACHE_SQLITE_MAX_SIZE'], *args, **kwargs)
+
+    def _set(self, key: str, value: Any, timeout: Optional[int | timedelta], only_if_missing: bool) -> bool:
+        seconds = self._normalize_timeout(timeout)    # 0 means that the entry does not expire
+        try:
+            return self.store.set(key, pickle.dumps(value), seconds or None, only_if_missing)
+        except sqlite3.Error:
+            logger.warning('Failed to write to the shared cache', exc_info=True)
+            return False
+
+    def get(self, key: str) -> Any:
+        try:
+            value = self.store.get(key)
+        except sqlite3.Error:
+            logger.warning('Failed to read from the shared cache', exc_info=True)
+            return None
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key: str, value: Any, timeout: Optional[int | timedelta] = None) -> bool:
+        return self._set(key, value, timeout, only_if_missing=False)
+
+    def add(self, key: str, value: Any, timeout: Optional[int | timedelta] = None) -> bool:
+        return self._set(key, value, timeout, only_if_missing=True)
+
+    def delete(self, key: str) -> bool:
+        try:
+            return self.store.delete(key)
+        except sqlite3.Error:
+            logger.warning('Failed to delete from the shared cache', exc_info=True)
+            return False
+
+    def has(self, key: str) -> bool:
+        try:
+            return self.store.has(key)
+        except sqlite3.Error:
+            logger.warning('Failed to read from the shared cache', exc_info=True)
+            return False
+
+    def clear(self) -> bool:
+        try:
+            self.store.clear()
+            return True
+        except sqlite3.Error:
+            logger.warning('Failed to clear the shared cache', exc_info=True)
+            return False
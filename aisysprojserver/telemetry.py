@@ -1,7 +1,6 @@
 import time
 from contextlib import contextmanager
 from functools import cached_property, wraps
-from pathlib import Path
 from typing import Optional, Iterable
 
 import psutil
@@ -14,7 +13,7 @@ from opentelemetry.sdk.metrics.view import ExplicitBucketHistogramAggregation, V
 from opentelemetry.sdk.resources import Resource, SERVICE_NAME, SERVICE_VERSION
 from prometheus_client import start_http_server
 
-from aisysprojserver import __version__
+from aisysprojserver import __version__, models, run
 from aisysprojserver.config import Config
 
 
@@ -64,6 +63,38 @@ class _Instruments:
             unit='1',
         )
 
+    @cached_property
+    def env_call_queue_duration_histogram(self) -> Histogram:
+        return self.meter.create_histogram(
+            name='env_call_queue_duration',
+            description='Time an environment call waits for a free slot/worker',
+            unit='ms',
+        )
+
+    @cached_property
+    def env_call_execution_duration_histogram(self) -> Histogram:
+        return self.meter.create_histogram(
+            name='env_call_execution_duration',
+            description='Time it takes to execute an environment call',
+            unit='ms',
+        )
+
+    @cached_property
+    def env_instance_cache_counter(self) -> Counter:
+        return self.meter.create_counter(
+            name='env_instance_cache',
+            description='Number of lookups in the environment instance cache',
+            unit='1',
+        )
+
+    @cached_property
+    def render_cache_counter(self) -> Counter:
+        return self.meter.create_counter(
+            name='render_cache',
+            description='Number of lookups in the cache for rendered pages',
+            unit='1',
+        )
+
 
 def get_pid() -> int:
     return psutil.Process().pid
@@ -104,18 +135,55 @@ def report_action(env_id: str, protocol_version: str, number_of_actions: int = 1
     )
 
 
-def _setup_db_size_gauge(config: Config):
+def report_env_call(env_class_refstr: str, method: str, queue_duration: float, execution_duration: Optional[float],
+                    outcome: str):
+    """ durations are in seconds (execution_duration is None if the call was not executed) """
+    attributes: dict[str, str | int] = {
+        'env_class': env_class_refstr, 'method': method, 'outcome': outcome, 'pid': get_pid()
+    }
+    _instruments.env_call_queue_duration_histogram.record(queue_duration * 1000, attributes)
+    if execution_duration is not None:
+        _instruments.env_call_execution_duration_histogram.record(execution_duration * 1000, attributes)
+
+
+def report_env_instance_cache(env_class_refstr: str, hit: bool):
+    _instruments.env_instance_cache_counter.add(
+        1, {'env_class': env_class_refstr, 'pid': get_pid(), 'result': 'hit' if hit else 'miss'}
+    )
+
+
+def report_render_cache(page_type: str, hit: bool):
+    _instruments.render_cache_counter.add(
+        1, {'page_type': page_type, 'pid': get_pid(), 'result': 'hit' if hit else 'miss'}
+    )
+
+
+def _setup_db_size_gauge():
     def get_db_size(_options: CallbackOptions) -> Iterable[Observation]:
-        if config.DATABASE_URI.startswith('sqlite:///'):
-            yield Observation(Path(config.DATABASE_URI[len('sqlite:///'):]).stat().st_size / 1024 / 1024)
+        if (size := models.get_database_size()) is not None:
+            yield Observation(size / 1024 / 1024)
+
+    def get_state_compression_ratio(_options: CallbackOptions) -> Iterable[Observation]:
+        with models.Session() as session:
+            compressed_size, original_size = run.sample_state_compression(session)
+        if original_size:
+            yield Observation(compressed_size / original_size)
 
     _instruments.meter.create_observable_gauge(
         name='db_size',
-        description='Size of the database file (currently only for SQLite)',
+        description='Size of the database (SQLite or PostgreSQL)',
         unit='MiB',
         callbacks=[get_db_size]
     )
 
+    _instruments.meter.create_observable_gauge(
+        name='db_state_compression_ratio',
+        description='Compressed size / original size of the compressed run states '
+                    '(sampled from the most recent runs in the database; action histories are not compressed)',
+        unit='1',
+        callbacks=[get_state_compression_ratio]
+    )
+
 
 def _setup_system_metrics():
     def get_cpu_usage(options: CallbackOptions) -> Iterable[Observation]:
@@ -202,5 +270,5 @@ def setup(config: Config):
 
     _instruments.set_meter(metrics.get_meter('aisysproj-meter'))
 
-    _setup_db_size_gauge(config)
+    _setup_db_size_gauge()
     _setup_system_metrics()
@@ -1,3 +1,5 @@
+import abc
+import io
 from typing import Any, TypeVar
 
 from pydantic import ValidationError, BaseModel, ConfigDict
@@ -25,6 +27,81 @@ except (ImportError, ModuleNotFoundError):
         return json.loads(string)
 
 
+class StateCodec(abc.ABC):
+    """ Serialization of the states of runs (see ``EnvSettings.STATE_CODEC``) """
+    @abc.abstractmethod
+    def encode(self, state: Any) -> bytes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def decode(self, data: bytes) -> Any:
+        raise NotImplementedError()
+
+
+class JSONCodec(StateCodec):
+    def encode(self, state: Any) -> bytes:
+        return json_dump(state).encode()
+
+    def decode(self, data: bytes) -> Any:
+        return json_load(data.decode())
+
+
+class MsgpackCodec(StateCodec):
+    """ msgpack (requires the ``msgpack`` package) - numpy arrays are supported as well """
+    _NUMPY_EXT_TYPE: int = 1
+
+    def __init__(self):
+        import msgpack  # type: ignore
+        self.msgpack = msgpack
+
+    def _default(self, obj):
+        import numpy
+        if isinstance(obj, numpy.ndarray):
+            return self.msgpack.ExtType(self._NUMPY_EXT_TYPE, NumpyCodec().encode(obj))
+        raise TypeError(f'Cannot serialize {type(obj).__name__} with msgpack')
+
+    def _ext_hook(self, code: int, data: bytes):
+        if code == self._NUMPY_EXT_TYPE:
+            return NumpyCodec().decode(data)
+        return self.msgpack.ExtType(code, data)
+
+    def encode(self, state: Any) -> bytes:
+        return self.msgpack.packb(state, default=self._default)
+
+    def decode(self, data: bytes) -> Any:
+        return self.msgpack.unpackb(data, ext_hook=self._ext_hook)
+
+
+class NumpyCodec(StateCodec):
+    """ a single numpy array (raw buffer with a header for dtype and shape, i.e. the ``.npy`` format) """
+    def encode(self, state: Any) -> bytes:
+        import numpy
+        buffer = io.BytesIO()
+        numpy.save(buffer, state, allow_pickle=False)
+        return buffer.getvalue()
+
+    def decode(self, data: bytes) -> Any:
+        import numpy
+        return numpy.load(io.BytesIO(data), allow_pickle=False)
+
+
+STATE_CODECS: dict[str, type[StateCodec]] = {
+    'json': JSONCodec,
+    'msgpack': MsgpackCodec,
+    'numpy': NumpyCodec,
+}
+
+_state_codec_instances: dict[str, StateCodec] = {}
+
+
+def get_state_codec(name: str) -> StateCodec:
+    if name not in _state_codec_instances:
+        if name not in STATE_CODECS:
+            raise ValueError(f'Unsupported state codec {name!r}')
+        _state_codec_instances[name] = STATE_CODECS[name]()
+    return _state_codec_instances[name]
+
+
 PYDANTIC_REQUEST_CONFIG = ConfigDict(frozen=True, extra='ignore', populate_by_name=True)
 
 
@@ -1,16 +1,34 @@
 import logging
+import multiprocessing
+import os
+import sys
 
-from aisysprojserver import telemetry
+from aisysprojserver import telemetry, run_pool, archive, models
 from aisysprojserver.app import create_app
 from aisysprojserver.config import UwsgiConfig
+from aisysprojserver.plugins import PluginManager
 
+import uwsgi  # type: ignore
 from uwsgidecorators import postfork  # type: ignore
 
+# sys.executable is the uwsgi binary, but the worker processes of ``env_executor`` have to be started with python
+multiprocessing.set_executable(os.path.join(sys.exec_prefix, 'bin', 'python'))
+
 config = UwsgiConfig()
 app = create_app(config)
 
+# other worker processes still have the old version of an uploaded plugin loaded
+PluginManager.upload_hooks.append(uwsgi.reload)
+
 
 @postfork
-def setup_telemetry():
+def setup_worker():
+    # the app was created in the master process - its database connections must not be used by the forked workers
+    # (close=False: the connections still belong to the master, so they must not be closed here)
+    models.engine.dispose(close=False)
     logging.info('Setting up telemetry (uwsgi postfork)')
     telemetry.setup(config)
+    # threads do not survive forking - and a single process is enough for filling the run pools and archiving
+    run_pool.setup(config.RUN_POOL_FILL_INTERVAL if uwsgi.worker_id() == 1 else None)
+    if uwsgi.worker_id() == 1:
+        archive.start_background_archiving(config.ARCHIVE_INTERVAL)
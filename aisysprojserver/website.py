@@ -5,7 +5,7 @@ from flask import url_for
 from flask_caching import Cache     # type: ignore
 from werkzeug.exceptions import NotFound, BadRequest
 
-from aisysprojserver import __version__
+from aisysprojserver import __version__, archive, render_cache
 from aisysprojserver.active_env import ActiveEnvironment
 from aisysprojserver.agent_account import AgentAccount
 from aisysprojserver.agent_data import AgentData
@@ -64,42 +64,59 @@ def group_page(group: str | Group):
     )
 
 
+# env, agent and run pages are cached in the render cache instead (see ``render_cache.py``)
 @bp.route('/env/<env>')
-@cache.cached(timeout=10)
 def env_page(env: str):
     active_env = ActiveEnvironment(env)
     if not active_env.exists():
         raise NotFound()
-    return active_env.get_env_instance().view_env(active_env.get_env_data())
+    version = active_env.get_content_version()
+    if (html := render_cache.get(env, 'env', version)) is None:
+        html = active_env.get_env_instance().view_env(active_env.get_env_data())
+        render_cache.put(env, 'env', version, html)
+    return html
 
 
 @bp.route('/agent/<env>/<agent>')
-@cache.cached(timeout=5)
 def agent_page(env: str, agent: str):
     active_env = ActiveEnvironment(env)
     if not active_env.exists():
         raise NotFound()
+    version = active_env.get_content_version()
     agent_data = AgentData(f'{env}/{agent}')
     if not agent_data.exists():
         if AgentAccount(env, agent).exists():
             return _jinja_env.get_template('agent_without_runs.html').render(agent_identifier=agent,
                                                                              **TEMPLATE_STANDARD_KWARGS)
         raise NotFound()
-    return active_env.get_env_instance().view_agent(agent_data.to_agent_data_summary())
+    page = f'agent/{agent}'
+    if (html := render_cache.get(env, page, version)) is None:
+        html = active_env.get_env_instance().view_agent(agent_data.to_agent_data_summary())
+        render_cache.put(env, page, version, html)
+    return html
 
 
 @bp.route('/run/<env>/<runid>')
-@cache.cached(timeout=3)
 def run_page(env: str, runid: str):
     active_env = ActiveEnvironment(env)
     if not active_env.exists():
         raise NotFound()
+    page = f'run/{runid}'
+    if (html := render_cache.get(env, page, 0)) is not None:
+        return html
     run = Run(runid)
-    if not run.exists():
+    if run.exists():
+        env_id, run_data, finished = run.env_str(), run.to_run_data(), run.is_finished()
+    elif runid.isdigit() and (archived := archive.load_run(int(runid))) is not None:
+        (env_id, run_data), finished = archived, True
+    else:
         raise NotFound()
-    if run.env_str() != active_env.identifier:
+    if env_id != active_env.identifier:
         raise BadRequest(f'Run {runid} is not part of {env}')
-    return active_env.get_env_instance().view_run(run.to_run_data())
+    html = active_env.get_env_instance().view_run(run_data)
+    if finished:    # finished runs never change
+        render_cache.put(env, page, 0, html)
+    return html
 
 
 @bp.route('/plugins')
@@ -5,7 +5,7 @@ import io
 import json
 import logging
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Iterator, Optional
 from zipfile import ZipFile
 
 import requests
@@ -41,6 +41,12 @@ class AdminClient:
         logger.log(response_log_level, f'Got a {response.status_code} response with content: {response.text}')
         return response.status_code, response.json()
 
+    def send_streaming_request(self, path: str, **kwargs) -> Iterator[bytes]:
+        """ Yields the lines of the response (overwritten for integration tests) """
+        with requests.request(url=self.base_url + path, stream=True, **kwargs) as response:
+            response.raise_for_status()
+            yield from response.iter_lines()
+
     def new_user(self, env: str, user: str, overwrite: bool = False) -> tuple[int, Any]:
         code, content = self.send_request(f'makeagent/{env}/{user}', method='POST', json={
             'overwrite': overwrite,
@@ -94,10 +100,35 @@ class AdminClient:
         assert code == 200
         return content
 
+    def export_results(self, env: str, include_runs: bool = False) -> Iterator[dict]:
+        """ Yields the results of all agents (``'type': 'agent'``) and,
+        if ``include_runs``, the outcomes of all finished runs (``'type': 'run'``) """
+        for line in self.send_streaming_request(
+                f'export/{env}', method='GET', json={'admin-pwd': self.pwd, 'include-runs': include_runs}
+        ):
+            if line:
+                yield json.loads(line)
+
     def remove_nonrecent_runs(self, just_vacuum: bool = False):
-        code, content = self.send_request(
-            'removenonrecentruns', method='GET', json={'admin-pwd': self.pwd, 'just-vacuum': just_vacuum}
-        )
+        """ archives the finished non-recent runs (see ``vacuum`` for shrinking the database afterwards) """
+        if just_vacuum:
+            return self.vacuum()
+        code, content = self.send_request('removenonrecentruns', method='GET', json={'admin-pwd': self.pwd})
+        assert code == 200
+        return content
+
+    def vacuum(self):
+        code, content = self.send_request('vacuum', method='GET', json={'admin-pwd': self.pwd})
+        assert code == 200
+        return content
+
+    def migrate_run_histories(self):
+        code, content = self.send_request('migraterunhistories', method='GET', json={'admin-pwd': self.pwd})
+        assert code == 200
+        return content
+
+    def migrate_rating_states(self):
+        code, content = self.send_request('migrateratingstates', method='GET', json={'admin-pwd': self.pwd})
         assert code == 200
         return content
 
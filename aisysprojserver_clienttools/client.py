@@ -14,6 +14,7 @@ import dataclasses
 import json
 import logging
 import multiprocessing
+import random
 import time
 from multiprocessing import Process
 from multiprocessing.connection import Connection
@@ -24,6 +25,9 @@ import requests as requests_lib
 
 logger = logging.getLogger(__name__)
 
+# re-using the session keeps the connection to the server alive between requests
+_session = requests_lib.Session()
+
 # type info (not using e.g. pydantic to keep dependencies minimal)
 AgentConfig = TypedDict('AgentConfig', {'agent': str, 'env': str, 'url': str, 'pwd': str})
 Action = TypedDict('Action', {'run': str, 'act_no': int, 'action': Any})
@@ -47,12 +51,21 @@ def get_run_url(agent_config: AgentConfig, run_id: str) -> str:
     return url + f'run/{agent_config["env"]}/{run_id}'
 
 
-def _handle_response(response) -> Optional[ServerResponse]:
+def _get_retry_delay(response, attempt: int) -> float:
+    """ uses the Retry-After header if provided, otherwise exponential backoff (with jitter to spread out clients) """
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        return min(2 ** attempt, 60) * random.uniform(0.5, 1.5)
+
+
+def _handle_response(response, attempt: int = 0) -> Optional[ServerResponse]:
     if response.status_code == 200:
         return response.json()
     elif response.status_code == 503:
-        logger.warning('Server is busy - retrying in 3 seconds')
-        time.sleep(3)
+        delay = _get_retry_delay(response, attempt)
+        logger.warning(f'Server is busy - retrying in {delay:.1f} seconds')
+        time.sleep(delay)
         return None
     else:  # in other cases, retrying does not help (authentication problems, etc.)
         logger.error(f'Status code {response.status_code}.')
@@ -70,12 +83,13 @@ def send_request(
         to_abandon: Optional[list[str]] = None,
         parallel_runs: bool = True
 ) -> ServerResponse:
+    attempt = 0
     while True:  # retry until success
         logger.debug(f'Sending request with {len(actions) or "no"} actions: {actions}')
         base_url = config['url']
         if not base_url.endswith('/'):
             base_url += '/'
-        response = requests_lib.put(f'{base_url}act/{config["env"]}', json={
+        response = _session.put(f'{base_url}act/{config["env"]}', json={
             'protocol_version': 1,
             'agent': config['agent'],
             'pwd': config['pwd'],
@@ -84,9 +98,10 @@ def send_request(
             'parallel_runs': parallel_runs,
             'client': 'py-client-v1',
         })
-        result = _handle_response(response)
+        result = _handle_response(response, attempt)
         if result is not None:
             return result
+        attempt += 1
 
 
 @dataclasses.dataclass(frozen=True)
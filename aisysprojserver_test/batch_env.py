@@ -0,0 +1,42 @@
+""" An environment that only implements the batch methods (it is not a plugin, but can be referenced like one) """
+from typing import Any
+
+from aisysprojserver.env_interface import GenericEnvironment, RunData, ActionResult, ActionRequest
+from aisysprojserver.env_settings import EnvSettings
+
+
+class BatchEnvironment(GenericEnvironment):
+    settings = EnvSettings()
+    settings.NUMBER_OF_ACTION_REQUESTS = 3
+
+    # (method, batch size) for every call
+    calls: list[tuple[str, int]] = []
+
+    def act_batch(self, actions: list[tuple[Any, RunData]]) -> list[ActionResult]:
+        self.calls.append(('act_batch', len(actions)))
+        return [ActionResult(new_state=run_data.state + action) for action, run_data in actions]
+
+    def new_runs(self, number: int) -> list[Any]:
+        self.calls.append(('new_runs', number))
+        return [0] * number
+
+    def get_action_requests(self, run_data: list[RunData]) -> list[ActionRequest]:
+        self.calls.append(('get_action_requests', len(run_data)))
+        return [ActionRequest(content=rd.state) for rd in run_data]
+
+    def act(self, action: Any, run_data: RunData) -> ActionResult:
+        raise AssertionError('act_batch should be used')
+
+    def new_run(self) -> Any:
+        raise AssertionError('new_runs should be used')
+
+    def get_action_request(self, run_data: RunData) -> ActionRequest:
+        raise AssertionError('get_action_requests should be used')
+
+
+class PooledBatchEnvironment(BatchEnvironment):
+    settings = EnvSettings()
+    settings.NUMBER_OF_ACTION_REQUESTS = 3
+    settings.RUN_POOL_SIZE = 4
+
+    calls: list[tuple[str, int]] = []
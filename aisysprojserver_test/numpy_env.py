@@ -0,0 +1,22 @@
+""" An environment with numpy states (it is not a plugin, but can be referenced like one) """
+from typing import Any
+
+import numpy
+
+from aisysprojserver.env_interface import GenericEnvironment, RunData, ActionResult, ActionRequest
+from aisysprojserver.env_settings import EnvSettings
+
+
+class NumpyEnvironment(GenericEnvironment):
+    settings = EnvSettings()
+    settings.STATE_CODEC = 'numpy'
+
+    def act(self, action: Any, run_data: RunData) -> ActionResult:
+        assert isinstance(run_data.state, numpy.ndarray)
+        return ActionResult(new_state=run_data.state + int(action))
+
+    def new_run(self) -> Any:
+        return numpy.zeros((3, 3), dtype=numpy.int8)
+
+    def get_action_request(self, run_data: RunData) -> ActionRequest:
+        return ActionRequest(content=run_data.state.tolist())
@@ -1,11 +1,12 @@
+import logging
 import unittest
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator
 
 from flask import Flask
 from flask.testing import FlaskClient
 
-from aisysprojserver import config, models
+from aisysprojserver import config, models, render_cache
 from aisysprojserver.app import create_app
 from aisysprojserver_clienttools.admin import AdminClient
 from aisysprojserver_clienttools.client import AgentConfig
@@ -24,6 +25,12 @@ class TestAdmin(AdminClient):
         response = self.client.open(path, **kwargs)
         return response.status_code, response.get_json()
 
+    def send_streaming_request(self, path: str, **kwargs) -> Iterator[bytes]:
+        response = self.client.open(path, **kwargs)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        for chunk in response.iter_encoded():
+            yield from chunk.splitlines()
+
     def send_request_raw(self, path: str, **kwargs):
         return self.client.open(path, **kwargs)
 
@@ -60,6 +67,7 @@ class ServerTestCase(unittest.TestCase):
         """ Load a basic setup (environment and agents) to support testing """
         models.Base.metadata.drop_all(bind=models.engine)
         models.Base.metadata.create_all(bind=models.engine)
+        render_cache.clear()    # the cache might contain pages from a previous test session
 
         package = Path(__file__).parent.parent / 'example_envs' / 'simple_nim'
         assert package.is_dir(), f'{package} does not exist'
@@ -75,6 +83,39 @@ class ServerTestCase(unittest.TestCase):
 
         cls._standard_setup_loaded = True
 
+    def act(self, config, number_of_requests, action_function, protocol_version=1):
+        assert protocol_version in {0, 1}
+        logger = logging.getLogger(__name__)
+
+        actions: list = []
+        for request_number in range(number_of_requests):
+            logger.debug(f'Iteration {request_number}')
+            # send request
+            logger.debug('Sending actions', actions)
+            request_content = {
+                'agent': config['agent'],
+                'pwd': config['pwd'],
+                'actions': actions,
+            }
+            if protocol_version == 1:
+                request_content['protocol_version'] = 1
+            code, content = self.admin.send_request(f'/act/{config["env"]}', method='PUT', json=request_content)
+            if code == 200:
+                action_requests = content['action-requests' if protocol_version == 0 else 'action_requests']
+                actions = []
+                for action_request in action_requests:
+                    action_json = {
+                        'run': action_request['run'],
+                        'action': action_function(action_request['percept'])
+                    }
+                    if protocol_version == 1:
+                        action_json['act_no'] = action_request['act_no']
+                    actions.append(action_json)
+            else:
+                return code
+
+        return 200
+
     #     def act_nim(self, username: Optional[str] = None, password: Optional[str] = None, try_win: bool = True,
     #                 move: Optional[int] = None):
     #         username = username or 'testuser'
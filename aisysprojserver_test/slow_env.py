@@ -0,0 +1,57 @@
+""" Environments for testing the ``env_executor`` and concurrent action evaluation
+(they are not plugins, but can be referenced like one) """
+import threading
+import time
+from typing import Any
+
+from aisysprojserver.env_interface import GenericEnvironment, RunData, ActionResult, ActionRequest, EnvInfo
+from aisysprojserver.env_settings import EnvSettings
+
+
+class SlowEnvironment(GenericEnvironment):
+    settings = EnvSettings()
+    settings.CONCURRENT_ACTION_EVALUATION = True
+
+    # actions 'barrier' only succeed if two of them are evaluated concurrently
+    barrier = threading.Barrier(2, timeout=10)
+
+    def act(self, action: Any, run_data: RunData) -> ActionResult:
+        if action == 'barrier':
+            self.barrier.wait()
+            return ActionResult(new_state=run_data.state + 1, message=f'run {run_data.run_id} passed the barrier')
+        if action == 'sleep':
+            time.sleep(60)
+        if action == 'fail':
+            raise ValueError('failing as requested')
+        if action == 'unstorable':
+            return ActionResult(new_state={'not', 'serializable'})
+        return ActionResult(new_state=run_data.state + 1)
+
+    def new_run(self) -> Any:
+        return 0
+
+    def get_action_request(self, run_data: RunData) -> ActionRequest:
+        return ActionRequest(content=run_data.state)
+
+
+class StatefulEnvironment(GenericEnvironment):
+    """ Stores the run that is processed in the (shared) environment object, i.e. ``act`` is not thread-safe """
+    # the largest number of concurrent ``act`` calls
+    max_concurrent_calls: int = 0
+
+    def __init__(self, env_info: EnvInfo, config_json: Any):
+        GenericEnvironment.__init__(self, env_info, config_json)
+        self.current_runs: list[int] = []
+
+    def act(self, action: Any, run_data: RunData) -> ActionResult:
+        self.current_runs.append(run_data.run_id)
+        StatefulEnvironment.max_concurrent_calls = max(self.max_concurrent_calls, len(self.current_runs))
+        time.sleep(0.05)
+        self.current_runs.remove(run_data.run_id)
+        return ActionResult(new_state=run_data.state + 1)
+
+    def new_run(self) -> Any:
+        return 0
+
+    def get_action_request(self, run_data: RunData) -> ActionRequest:
+        return ActionRequest(content=run_data.state)
@@ -1,43 +1,20 @@
 import copy
-import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from aisysprojserver import models, act
+from aisysprojserver.agent_account import AgentAccount
+from aisysprojserver.run import Run, append_action, get_action_history, encode_state
+from aisysprojserver_test.batch_env import BatchEnvironment
 from aisysprojserver_test.servertestcase import ServerTestCase, get_strong_nim_move
 
 
 class ActTest(ServerTestCase):
-    def act(self, config, number_of_requests, action_function, protocol_version=1):
-        assert protocol_version in {0, 1}
-        logger = logging.getLogger(__name__)
-
-        actions: list = []
-        for request_number in range(number_of_requests):
-            logger.debug(f'Iteration {request_number}')
-            # send request
-            logger.debug('Sending actions', actions)
-            request_content = {
-                'agent': config['agent'],
-                'pwd': config['pwd'],
-                'actions': actions,
-            }
-            if protocol_version == 1:
-                request_content['protocol_version'] = 1
-            code, content = self.admin.send_request(f'/act/{config["env"]}', method='PUT', json=request_content)
-            if code == 200:
-                action_requests = content['action-requests' if protocol_version == 0 else 'action_requests']
-                actions = []
-                for action_request in action_requests:
-                    action_json = {
-                        'run': action_request['run'],
-                        'action': action_function(action_request['percept'])
-                    }
-                    if protocol_version == 1:
-                        action_json['act_no'] = action_request['act_no']
-                    actions.append(action_json)
-            else:
-                return code
-
-        return 200
-
     def test_act_simple(self):
         self.require_standard_setup()
         for i in range(5):
@@ -57,3 +34,270 @@ class ActTest(ServerTestCase):
         config = copy.deepcopy(self._testuser_content)
         config['pwd'] = 'wrongpassword'
         self.assertEqual(self.act(config, 2, get_strong_nim_move), 401)
+
+    def test_act_blocked_agent(self):
+        self.require_standard_setup()
+        username = self.get_username()
+        code, config = self.admin.new_user('test-nim', username)
+        self.assertEqual(code, 200)
+        self.assertEqual(self.act(config, 2, get_strong_nim_move), 200)
+        AgentAccount('test-nim', username).block()   # authentication might be cached at this point
+        self.assertEqual(self.act(config, 1, get_strong_nim_move), 401)
+        AgentAccount('test-nim', username).unblock()
+        self.assertEqual(self.act(config, 1, get_strong_nim_move), 200)
+
+    def test_act_batch_with_bad_action(self):
+        self.require_standard_setup()
+        config = self._testuser_content
+        request_content = {'agent': config['agent'], 'pwd': config['pwd'], 'protocol_version': 1}
+        code, content = self.admin.send_request(f'/act/{config["env"]}', method='PUT', json=request_content)
+        self.assertEqual(code, 200)
+        action_requests = content['action_requests']
+        actions = [
+            {'run': ar['run'], 'act_no': ar['act_no'], 'action': get_strong_nim_move(ar['percept'])}
+            for ar in action_requests
+        ]
+        # a second action for the same run (its action number is outdated after the first action)
+        actions.insert(1, {'run': action_requests[0]['run'], 'act_no': 0, 'action': 17})
+        actions.append({'run': 'not-a-run', 'act_no': 0, 'action': 1})
+        request_content['actions'] = actions
+        code, content = self.admin.send_request(f'/act/{config["env"]}', method='PUT', json=request_content)
+        self.assertEqual(code, 200)
+        errors = [(m['run'], m['content']) for m in content['messages'] if m['type'] == 'error']
+        self.assertEqual(errors, [
+            (action_requests[0]['run'],
+             'Wrong action number 0 (the action might have been for an earlier action request)'),
+            ('not-a-run', 'Invalid run id'),
+        ])
+        act_nos = {ar['run']: ar['act_no'] for ar in content['action_requests']}
+        for ar in action_requests:
+            if ar['run'] in act_nos:
+                self.assertEqual(act_nos[ar['run']], ar['act_no'] + 1)
+
+    def test_busy_database(self):
+        self.require_standard_setup()
+        config = self._testuser_content
+        lock_error = OperationalError('UPDATE runs ...', {}, sqlite3.OperationalError('database is locked'))
+        with mock.patch.object(act.ActManager, 'process_actions', side_effect=lock_error):
+            response = self.admin.send_request_raw(f'/act/{config["env"]}', method='PUT', json={
+                'agent': config['agent'], 'pwd': config['pwd'], 'protocol_version': 1
+            })
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(response.json['errorcode'], 503)
+
+    def test_legacy_history_migration(self):
+        self.require_standard_setup()
+        username = self.get_username()
+        code, config = self.admin.new_user('test-nim', username)
+        self.assertEqual(code, 200)
+        with models.Session() as session:
+            run_model = models.RunModel(environment='test-nim', agent=f'test-nim/{username}', finished=False,
+                                        outstanding_action=True, state='{"remaining":6,"initial":10}',
+                                        history='[[1,3]]', outcome='null')
+            session.add(run_model)
+            session.commit()
+            run_id = str(run_model.identifier)
+
+        request_content = {
+            'agent': config['agent'], 'pwd': config['pwd'], 'protocol_version': 1,
+            'actions': [{'run': run_id, 'act_no': 1, 'action': 2}],
+        }
+        code, content = self.admin.send_request(f'/act/{config["env"]}', method='PUT', json=request_content)
+        self.assertEqual(code, 200)
+        self.assertEqual(Run(run_id).to_run_data().action_history[0].action, 1)
+        self.assertEqual(len(Run(run_id).to_run_data().action_history), 2)
+        self.assertEqual(self.admin.migrate_run_histories()['result'], 'done')
+
+    def test_truncated_history(self):
+        self.require_standard_setup()
+        with models.Session() as session:
+            run_model = models.RunModel(environment='test-nim', agent='test-nim/testuser', finished=False,
+                                        outstanding_action=False, state='null', number_of_steps=0, outcome='null')
+            session.add(run_model)
+            session.flush()
+            for i in range(5):
+                append_action(run_model, i, None, session, history_limit=2)
+            session.commit()
+            self.assertEqual([e.action for e in get_action_history(run_model, session, history_limit=2)], [3, 4])
+            self.assertEqual(get_action_history(run_model, session, history_limit=0), [])
+            self.assertEqual(run_model.number_of_steps, 5)
+
+            # without a history, no steps have to be deleted
+            run_model.number_of_steps = 0  # type: ignore
+            deletes = self.record_statements('DELETE FROM run_steps', lambda: [
+                append_action(run_model, i, None, session, history_limit=0) for i in range(3)
+            ])
+            session.flush()
+            self.assertEqual((deletes, run_model.number_of_steps), ([], 3))
+
+    def test_lowered_history_limit(self):
+        self.require_standard_setup()
+        with models.Session() as session:
+            run_model = models.RunModel(environment='test-nim', agent='test-nim/testuser', finished=False,
+                                        outstanding_action=False, state='null', number_of_steps=0, outcome='null')
+            session.add(run_model)
+            session.flush()
+            for i in range(4):      # e.g. while STORE_ACTION_HISTORY was enabled
+                append_action(run_model, i, None, session)
+            for i in range(4, 6):
+                append_action(run_model, i, None, session, history_limit=2)
+            session.commit()
+            history = get_action_history(run_model, session, history_limit=2)
+            self.assertEqual((len(history), [e.action for e in history]), (2, [4, 5]))
+            self.assertEqual(history[0].action, 4)
+
+    def test_concurrent_duplicate_submissions(self):
+        self.require_standard_setup()
+        username = self.get_username()
+        code, config = self.admin.new_user('test-nim', username)
+        self.assertEqual(code, 200)
+        request_content = {'agent': config['agent'], 'pwd': config['pwd'], 'protocol_version': 1}
+        code, content = self.admin.send_request(f'/act/{config["env"]}', method='PUT', json=request_content)
+        self.assertEqual(code, 200)
+        action_requests = content['action_requests']
+        request_content['actions'] = [
+            {'run': ar['run'], 'act_no': ar['act_no'], 'action': get_strong_nim_move(ar['percept'])}
+            for ar in action_requests
+        ]
+
+        with ThreadPoolExecutor(4) as executor:
+            responses = list(executor.map(
+                lambda _: self.admin.send_request(f'/act/{config["env"]}', method='PUT', json=request_content),
+                range(4)
+            ))
+        self.assertEqual([code for code, _ in responses], [200] * 4)
+        errors = [m for _, content in responses for m in content['messages'] if m['type'] == 'error']
+        self.assertEqual(len(errors), 3 * len(action_requests))
+        for ar in action_requests:
+            self.assertEqual(len(Run(ar['run']).get_history()), 1)
+
+    def test_batch_environment(self):
+        self.require_standard_setup()
+        code, _ = self.admin.make_env('aisysprojserver_test.batch_env:BatchEnvironment', 'test-batch',
+                                      'Batch Environment', overwrite=True)
+        self.assertEqual(code, 200)
+        code, agent = self.admin.new_user('test-batch', self.get_username())
+        self.assertEqual(code, 200)
+        BatchEnvironment.calls.clear()
+
+        actions: list = []
+        for _ in range(2):
+            code, content = self.admin.send_request('/act/test-batch', method='PUT', json={
+                'agent': agent['agent'], 'pwd': agent['pwd'], 'protocol_version': 1, 'actions': actions,
+            })
+            self.assertEqual(code, 200, content)
+            actions = [{'run': ar['run'], 'act_no': ar['act_no'], 'action': 2} for ar in content['action_requests']]
+
+        self.assertEqual([ar['percept'] for ar in content['action_requests']], [2, 2, 2])
+        self.assertEqual(BatchEnvironment.calls,
+                         [('new_runs', 3), ('get_action_requests', 3), ('act_batch', 3), ('get_action_requests', 3)])
+
+    def record_statements(self, prefix: str, send) -> list[str]:
+        """ records the SQL statements that start with ``prefix`` while ``send()`` is called """
+        statements: list[str] = []
+
+        def record(_conn, _cursor, statement, *_args):
+            if statement.startswith(prefix):
+                statements.append(statement)
+
+        event.listen(models.engine, 'before_cursor_execute', record)
+        try:
+            send()
+        finally:
+            event.remove(models.engine, 'before_cursor_execute', record)
+        return statements
+
+    def test_new_runs_are_inserted_at_once(self):
+        self.require_standard_setup()
+        code, agent = self.admin.new_user('test-nim', self.get_username())
+        self.assertEqual(code, 200)
+
+        responses = []
+        inserts = self.record_statements('INSERT INTO runs', lambda: responses.append(self.admin.send_request(
+            '/act/test-nim', method='PUT',
+            json={'agent': agent['agent'], 'pwd': agent['pwd'], 'protocol_version': 1, 'actions': []}
+        )))
+        code, content = responses[0]
+        self.assertEqual(code, 200)
+        self.assertEqual(len(content['action_requests']), 5)
+        self.assertEqual([int(ar['run']) for ar in content['action_requests']],
+                         sorted(int(ar['run']) for ar in content['action_requests']))
+        self.assertEqual(len(inserts), 1)
+
+    def test_new_runs_with_identical_states(self):
+        self.require_standard_setup()
+        request = act.RequestV1(agent=self._testuser_content['agent'], pwd=self._testuser_content['pwd'])
+        with self.app.test_request_context(json=request.model_dump()):
+            manager = act.ActManager('test-nim', request)
+            states = [{'remaining': 10}, {'remaining': 10}, {'remaining': 7}]
+            with models.Session() as session:
+                identifiers = manager.insert_new_runs([encode_state(state) for state in states], states, session)
+                session.rollback()
+        # every run has its own state object (modifying one must not affect the others)
+        for identifier, state in zip(identifiers, states):
+            self.assertIs(manager.working_set[identifier].run_data.state, state)
+
+    def test_updated_runs_are_not_reloaded(self):
+        self.require_standard_setup()
+        code, agent = self.admin.new_user('test-nim', self.get_username())
+        self.assertEqual(code, 200)
+        request = {'agent': agent['agent'], 'pwd': agent['pwd'], 'protocol_version': 1, 'actions': []}
+        code, content = self.admin.send_request('/act/test-nim', method='PUT', json=request)
+        self.assertEqual(code, 200)
+        request['actions'] = [{'run': ar['run'], 'act_no': ar['act_no'], 'action': 1}
+                              for ar in content['action_requests']]
+
+        responses = []
+        selects = self.record_statements('SELECT runs.identifier, runs.environment', lambda: responses.append(
+            self.admin.send_request('/act/test-nim', method='PUT', json=request)
+        ))
+        code, content = responses[0]
+        self.assertEqual(code, 200)
+        self.assertEqual([ar['act_no'] for ar in content['action_requests']], [1] * 5)
+        self.assertEqual([ar['percept'] for ar in content['action_requests']], [8] * 5)
+        # the runs are loaded for computing the effects and for storing them - but not for the response
+        self.assertEqual(len(selects), 2)
+
+    def test_action_that_cannot_be_stored(self):
+        self.require_standard_setup()
+        code, _ = self.admin.make_env('aisysprojserver_test.slow_env:SlowEnvironment', 'test-slow', 'Slow Environment',
+                                      overwrite=True)
+        self.assertEqual(code, 200)
+        code, agent = self.admin.new_user('test-slow', self.get_username())
+        self.assertEqual(code, 200)
+        request = {'agent': agent['agent'], 'pwd': agent['pwd'], 'protocol_version': 1, 'actions': []}
+        code, content = self.admin.send_request('/act/test-slow', method='PUT', json=request)
+        self.assertEqual(code, 200)
+        stored, failing = content['action_requests'][:2]
+
+        request['actions'] = [{'run': stored['run'], 'act_no': 0, 'action': 'step'},
+                              {'run': failing['run'], 'act_no': 0, 'action': 'unstorable'}]
+        code, content = self.admin.send_request('/act/test-slow', method='PUT', json=request)
+        self.assertEqual(code, 200)
+        self.assertEqual([(m['run'], m['type']) for m in content['messages']], [(failing['run'], 'error')])
+        # the failing run is unchanged and gets a new action request
+        self.assertIn({'run': failing['run'], 'act_no': 0, 'percept': 0}, content['action_requests'])
+        self.assertEqual(len(Run(stored['run']).get_history()), 1)
+        self.assertEqual(len(Run(failing['run']).get_history()), 0)
+
+    def test_environment_is_called_without_write_lock(self):
+        self.require_standard_setup()
+        code, agent = self.admin.new_user('test-nim', self.get_username())
+        self.assertEqual(code, 200)
+
+        write_durations: dict[str, float] = {}
+
+        def call_env(manager, method, *args):
+            start = time.time()
+            with models.Session() as session:   # e.g. an /act request of another agent
+                models.begin_write_transaction(session)
+                session.commit()
+            write_durations[method] = max(write_durations.get(method, 0), time.time() - start)
+            return original(manager, method, *args)
+
+        original = act.ActManager.call_env
+        with mock.patch.object(act.ActManager, 'call_env', autospec=True, side_effect=call_env):
+            self.assertEqual(self.act(agent, 2, get_strong_nim_move), 200)
+        self.assertEqual(set(write_durations), {'new_runs', 'get_action_requests', 'act'})
+        self.assertLess(max(write_durations.values()), 1)
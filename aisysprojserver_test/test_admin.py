@@ -0,0 +1,63 @@
+import sqlalchemy
+
+from aisysprojserver import archive, models
+from aisysprojserver.util import json_load
+from aisysprojserver_test.servertestcase import ServerTestCase, get_strong_nim_move
+
+
+class AdminTest(ServerTestCase):
+    def test_remove_nonrecent_runs(self):
+        self.require_standard_setup()
+        self.assertEqual(self.act(self._testuser_content, 3, get_strong_nim_move), 200)
+        self.assertEqual(self.admin.remove_nonrecent_runs()['result'], 'done')
+        self.assertEqual(self.admin.vacuum()['result'], 'done')
+        self.assertEqual(self.admin.remove_nonrecent_runs(just_vacuum=True)['result'], 'done')
+
+    def test_export(self):
+        self.require_standard_setup()
+        code, _ = self.admin.make_env('simple_nim.environment:Environment', 'test-export', 'Export Test (Nim)',
+                                      config={'strong': True, 'random_start': False}, overwrite=True)
+        self.assertEqual(code, 200)
+        usernames = [self.get_username() for _ in range(2)]
+        for username in usernames:
+            code, agent = self.admin.new_user('test-export', username)
+            self.assertEqual(code, 200)
+            self.assertEqual(self.act(agent, 40, get_strong_nim_move), 200)
+        self.assertGreater(archive.archive_runs('test-export'), 0)
+
+        lines = list(self.admin.export_results('test-export'))
+        self.assertEqual({line['agent'] for line in lines}, set(usernames))
+        self.assertEqual({line['type'] for line in lines}, {'agent'})
+
+        # the runs include the archived ones
+        lines = list(self.admin.export_results('test-export', include_runs=True))
+        runs = [line for line in lines if line['type'] == 'run']
+        total_runs = sum(line['total-runs'] for line in lines if line['type'] == 'agent')
+        self.assertEqual(len(runs), total_runs)
+        self.assertEqual(len({run['run'] for run in runs}), total_runs)
+        with models.Session() as session:
+            outcomes = dict(session.execute(
+                sqlalchemy.select(models.RunModel.identifier, models.RunModel.outcome)
+                .where(models.RunModel.environment == 'test-export', models.RunModel.finished == True)  # noqa: E712
+            ).all())
+        self.assertTrue(outcomes)
+        for run in runs:
+            if run['run'] in outcomes:
+                self.assertEqual(run['outcome'], json_load(outcomes[run['run']]))
+
+    def test_migrate_rating_states(self):
+        self.require_standard_setup()
+        self.assertEqual(self.act(self._testuser_content, 5, get_strong_nim_move), 200)
+        with models.Session() as session:
+            agent = session.get(models.AgentDataModel, 'test-nim/testuser')
+            agent.rating_state = None
+            agent.recent_results = '[0, 1, 1, 1]'
+            session.commit()
+
+        self.assertGreaterEqual(self.admin.migrate_rating_states()['migrated-agents'], 1)
+        with models.Session() as session:
+            agent = session.get(models.AgentDataModel, 'test-nim/testuser')
+            self.assertIsNone(agent.recent_results)
+            self.assertTrue(agent.rating_state.startswith(b'average\0'))
+        self.assertEqual(self.act(self._testuser_content, 5, get_strong_nim_move), 200)
+        self.assertEqual(self.admin.migrate_rating_states()['migrated-agents'], 0)
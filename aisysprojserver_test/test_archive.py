@@ -0,0 +1,68 @@
+import time
+from unittest import mock
+
+import sqlalchemy
+
+from aisysprojserver import models, archive
+from aisysprojserver_test.servertestcase import ServerTestCase, get_strong_nim_move
+
+
+class ArchiveTest(ServerTestCase):
+    def count_finished_runs(self) -> int:
+        with models.Session() as session:
+            return session.scalar(sqlalchemy.select(sqlalchemy.func.count()).select_from(models.RunModel).where(
+                models.RunModel.environment == 'test-archive', models.RunModel.finished == True  # noqa: E712
+            ))
+
+    def test_archive(self):
+        self.require_standard_setup()
+        code, _ = self.admin.make_env('simple_nim.environment:Environment', 'test-archive', 'Archive Test (Nim)',
+                                      config={'strong': True, 'random_start': False}, overwrite=True)
+        self.assertEqual(code, 200)
+        code, agent = self.admin.new_user('test-archive', self.get_username())
+        self.assertEqual(code, 200)
+        self.assertEqual(self.act(agent, 40, get_strong_nim_move), 200)
+
+        finished = self.count_finished_runs()
+        self.assertGreater(finished, 20)
+        with models.Session() as session:
+            run_id = session.scalar(sqlalchemy.select(sqlalchemy.func.min(models.RunModel.identifier))
+                                    .where(models.RunModel.environment == 'test-archive'))
+            run_page = self.client.get(f'/run/test-archive/{run_id}').get_data()
+
+        # only the 20 recent runs of the agent remain in the database
+        self.assertEqual(archive.archive_runs('test-archive'), finished - 20)
+        self.assertEqual(self.count_finished_runs(), 20)
+        self.assertEqual(archive.archive_runs('test-archive'), 0)
+        self.assertEqual(archive.get_archived_run_ids([run_id]), {run_id})
+
+        # archived runs can still be viewed
+        response = self.client.get(f'/run/test-archive/{run_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), run_page)
+        self.assertEqual(self.client.get(f'/run/test-nim/{run_id}').status_code, 400)
+        self.assertEqual(self.client.get('/run/test-archive/999999999').status_code, 404)
+
+    def test_segments_are_written_without_write_lock(self):
+        self.require_standard_setup()
+        code, _ = self.admin.make_env('simple_nim.environment:Environment', 'test-archive-lock', 'Archive Test (Nim)',
+                                      config={'strong': True, 'random_start': False}, overwrite=True)
+        self.assertEqual(code, 200)
+        code, agent = self.admin.new_user('test-archive-lock', self.get_username())
+        self.assertEqual(code, 200)
+        self.assertEqual(self.act(agent, 40, get_strong_nim_move), 200)
+
+        write_durations: list[float] = []
+
+        def append_to_segment(*args):
+            start = time.time()
+            with models.Session() as session:   # e.g. an /act request
+                models.begin_write_transaction(session)
+                session.commit()
+            write_durations.append(time.time() - start)
+            return original(*args)
+
+        original = archive._append_to_segment
+        with mock.patch('aisysprojserver.archive._append_to_segment', side_effect=append_to_segment):
+            self.assertGreater(archive.archive_runs('test-archive-lock'), 0)
+        self.assertLess(max(write_durations), 1)
@@ -1,12 +1,15 @@
 import itertools
 import json
 import tempfile
+import unittest
 from contextlib import contextmanager
 from itertools import product
 from pathlib import Path
 from typing import Callable, Any
 
-from aisysprojserver_clienttools.client import AgentConfig, RequestInfo
+import requests
+
+from aisysprojserver_clienttools.client import AgentConfig, RequestInfo, _get_retry_delay
 from aisysprojserver_test.servertestcase import get_strong_nim_move, ServerTestCase
 
 
@@ -18,8 +21,8 @@ class ActTest(ServerTestCase):
     @contextmanager
     def _put_overwritten(self):
         # This is a hack to temporarily redirect requests to the flask test client
-        import requests
         original_put = requests.put
+        original_session_put = requests.Session.put
 
         def myput(*args, **kwargs):
             arg_list = list(args)
@@ -34,9 +37,11 @@ class ActTest(ServerTestCase):
             return result
         try:
             requests.put = myput
+            requests.Session.put = lambda _session, *args, **kwargs: myput(*args, **kwargs)    # type: ignore
             yield
         finally:
             requests.put = original_put
+            requests.Session.put = original_session_put     # type: ignore
 
     def simple_client_test(self, version: str, parallel_runs: bool, agent_config: Path | AgentConfig, **kwargs):
         run: Callable   # type: ignore
@@ -103,3 +108,24 @@ class ActTest(ServerTestCase):
                 with self._put_overwritten():
                     MyAgent.run(self._testuser_content, parallel_runs=True, abandon_old_runs=abandon_old_runs,
                                 multiprocessing=multiprocessing, run_limit=10)
+
+
+class RetryDelayTest(unittest.TestCase):
+    @staticmethod
+    def busy_response(retry_after: str | None = None) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 503
+        if retry_after is not None:
+            response.headers['Retry-After'] = retry_after
+        return response
+
+    def test_retry_after_header(self):
+        self.assertEqual(_get_retry_delay(self.busy_response('2'), attempt=5), 2)
+
+    def test_exponential_backoff(self):
+        for retry_after in [None, 'soon']:     # missing or malformed header
+            with self.subTest(retry_after=retry_after):
+                delays = [_get_retry_delay(self.busy_response(retry_after), attempt) for attempt in [0, 3, 10]]
+                self.assertTrue(0.5 <= delays[0] <= 1.5, delays)
+                self.assertTrue(4 <= delays[1] <= 12, delays)
+                self.assertTrue(30 <= delays[2] <= 90, delays)     # at most 60 seconds (plus jitter)
@@ -0,0 +1,79 @@
+from typing import Callable
+
+from aisysprojserver import env_executor
+from aisysprojserver.active_env import ActiveEnvironment
+from aisysprojserver_test.servertestcase import ServerTestCase
+from aisysprojserver_test.slow_env import StatefulEnvironment
+
+
+class EnvExecutorTest(ServerTestCase):
+    def make_slow_env_agent(self) -> Callable[[list], dict]:
+        """ returns a function for sending actions """
+        self.require_standard_setup()
+        code, _ = self.admin.make_env('aisysprojserver_test.slow_env:SlowEnvironment', 'test-slow', 'Slow Environment',
+                                      overwrite=True)
+        self.assertEqual(code, 200)
+        code, agent = self.admin.new_user('test-slow', self.get_username())
+        self.assertEqual(code, 200)
+
+        def send(actions: list) -> dict:
+            code, content = self.admin.send_request('/act/test-slow', method='PUT', json={
+                'agent': agent['agent'], 'pwd': agent['pwd'], 'protocol_version': 1, 'actions': actions,
+            })
+            self.assertEqual(code, 200, content)
+            return content
+
+        return send
+
+    def test_concurrent_evaluation(self):
+        send = self.make_slow_env_agent()
+        action_requests = send([])['action_requests']
+        self.assertGreaterEqual(len(action_requests), 2)
+        content = send([{'run': ar['run'], 'act_no': ar['act_no'], 'action': 'barrier'} for ar in action_requests[:2]])
+        # messages are in the order of the actions
+        self.assertEqual([m['content'] for m in content['messages']],
+                         [f'run {ar["run"]} passed the barrier' for ar in action_requests[:2]])
+
+    def test_no_concurrent_evaluation_by_default(self):
+        self.require_standard_setup()
+        code, _ = self.admin.make_env('aisysprojserver_test.slow_env:StatefulEnvironment', 'test-stateful',
+                                      'Stateful Environment', overwrite=True)
+        self.assertEqual(code, 200)
+        code, agent = self.admin.new_user('test-stateful', self.get_username())
+        self.assertEqual(code, 200)
+        request = {'agent': agent['agent'], 'pwd': agent['pwd'], 'protocol_version': 1, 'actions': []}
+        for _ in range(2):
+            code, content = self.admin.send_request('/act/test-stateful', method='PUT', json=request)
+            self.assertEqual(code, 200, content)
+            request['actions'] = [{'run': ar['run'], 'act_no': ar['act_no'], 'action': 1}
+                                  for ar in content['action_requests']]
+        self.assertEqual([ar['percept'] for ar in content['action_requests']], [1] * 5)
+        self.assertEqual(StatefulEnvironment.max_concurrent_calls, 1)
+
+    def test_process_pool(self):
+        send = self.make_slow_env_agent()
+
+        env_executor.set_executor(env_executor.ProcessPoolEnvExecutor(
+            max_concurrency=2, timeout=2, number_of_workers=1, plugins_dir=self.helper.configuration.PLUGINS_DIR
+        ))
+        try:
+            content = send([])
+            ar = content['action_requests'][0]
+            self.assertEqual(ar['percept'], 0)
+
+            # timeout -> error message, worker is replaced
+            content = send([{'run': ar['run'], 'act_no': ar['act_no'], 'action': 'sleep'}])
+            self.assertIn('did not respond', content['messages'][0]['content'])
+            ar = next(a for a in content['action_requests'] if a['run'] == ar['run'])
+            self.assertEqual(ar['act_no'], 0)
+
+            content = send([{'run': a['run'], 'act_no': a['act_no'], 'action': 'step'}
+                            for a in content['action_requests']])
+            self.assertEqual(content['messages'], [])
+            self.assertTrue(all((a['act_no'], a['percept']) == (1, 1) for a in content['action_requests']))
+
+            # exceptions in the worker are passed on
+            with self.assertRaises(ValueError):
+                env_executor.get_executor().call(ActiveEnvironment('test-slow'), 'act', 'fail', None)
+        finally:
+            env_executor.set_executor(env_executor.InlineEnvExecutor(None, 10))
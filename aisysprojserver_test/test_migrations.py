@@ -0,0 +1,110 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from sqlalchemy import create_engine, inspect, text
+
+from aisysprojserver import models, act
+from aisysprojserver.migrations import migrate, MIGRATIONS, get_schema_version
+
+# schema of the runs table before migrations were introduced (version 0.1.3)
+LEGACY_RUNS_TABLE = '''
+CREATE TABLE runs (
+    identifier INTEGER NOT NULL PRIMARY KEY,
+    environment VARCHAR,
+    agent VARCHAR,
+    finished BOOLEAN,
+    outstanding_action BOOLEAN,
+    state TEXT,
+    history TEXT,
+    outcome VARCHAR
+)
+'''
+
+
+def _postgres_available() -> bool:
+    if not (shutil.which('initdb') and shutil.which('pg_ctl')) or os.geteuid() == 0:
+        return False
+    try:
+        import psycopg2  # type: ignore # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class MigrationTest(unittest.TestCase):
+    def check_migration(self, engine):
+        with engine.begin() as connection:
+            for table in models.Base.metadata.sorted_tables:
+                if table.name not in {'runs', 'run_steps'}:
+                    table.create(connection)
+            connection.execute(text(LEGACY_RUNS_TABLE))
+            connection.execute(text(
+                "INSERT INTO runs (identifier, agent, finished, history) VALUES (1, 'env/agent', FALSE, '[[1,2]]')"
+            ))
+
+        migrate(engine)
+        migrate(engine)    # should not change anything
+
+        with engine.connect() as connection:
+            self.assertEqual(get_schema_version(connection), len(MIGRATIONS))
+            self.assertIn('number_of_steps', {c['name'] for c in inspect(connection).get_columns('runs')})
+            self.assertTrue(inspect(connection).has_table('run_steps'))
+            self.assertEqual(connection.execute(text('SELECT history FROM runs')).scalar(), '[[1,2]]')
+
+    def test_sqlite_migration(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            engine = create_engine(f'sqlite:///{tmpdir}/test.db')
+            self.check_migration(engine)
+            engine.dispose()
+
+    def test_active_runs_index(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            engine = create_engine(f'sqlite:///{tmpdir}/test.db')
+            with engine.begin() as connection:     # a database with schema version 2
+                for table in models.Base.metadata.sorted_tables:
+                    if table.name not in {'runs', 'run_steps', 'run_pool'}:
+                        table.create(connection)
+                connection.execute(text(LEGACY_RUNS_TABLE))
+                for migration in MIGRATIONS[:2]:
+                    migration(connection)
+                connection.execute(text("INSERT INTO keyval VALUES ('#schema-version', '2')"))
+            migrate(engine)
+
+            with engine.connect() as connection:
+                indexes = {index['name'] for index in inspect(connection).get_indexes('runs')}
+                self.assertIn('ix_runs_agent_finished_identifier', indexes)
+                query = act.select_active_runs('env/agent').compile(engine, compile_kwargs={'literal_binds': True})
+                plan = ' '.join(row[-1] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {query}')))
+            self.assertIn('USING INDEX ix_runs_agent_finished_identifier', plan)
+            self.assertNotIn('TEMP B-TREE', plan)   # sorted by the index
+            engine.dispose()
+
+    def test_new_database(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            engine = create_engine(f'sqlite:///{tmpdir}/test.db')
+            migrate(engine)
+            with engine.connect() as connection:
+                self.assertEqual(get_schema_version(connection), len(MIGRATIONS))
+            engine.dispose()
+
+    @unittest.skipUnless(_postgres_available(), 'requires PostgreSQL binaries (initdb, pg_ctl), psycopg2 and non-root')
+    def test_postgres_migration(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data = Path(tmpdir) / 'data'
+            subprocess.run(['initdb', '-D', str(data), '-A', 'trust'], check=True, capture_output=True)
+            subprocess.run(
+                ['pg_ctl', '-D', str(data), '-w', '-o', f"-k {tmpdir} -c listen_addresses='' -p 54329", 'start'],
+                check=True, capture_output=True
+            )
+            try:
+                time.sleep(0.5)
+                engine = create_engine(f'postgresql+psycopg2:///postgres?host={tmpdir}&port=54329')
+                self.check_migration(engine)
+                engine.dispose()
+            finally:
+                subprocess.run(['pg_ctl', '-D', str(data), '-w', 'stop'], check=True, capture_output=True)
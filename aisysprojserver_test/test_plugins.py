@@ -1,3 +1,4 @@
+from aisysprojserver.active_env import ActiveEnvironment
 from aisysprojserver.plugins import PluginManager
 from aisysprojserver_test.servertestcase import ServerTestCase
 
@@ -6,3 +7,20 @@ class PluginTest(ServerTestCase):
     def test_import_simple_nim(self):
         self.require_standard_setup()
         self.assertEqual(PluginManager.plugins['simple_nim'].version, '0.0.2')
+
+    def test_env_instance_cache(self):
+        self.require_standard_setup()
+        code, _ = self.admin.make_env('simple_nim.environment:Environment', 'test-nim-cache',
+                                      'Test Environment (Nim)', config={'strong': True, 'random_start': False},
+                                      overwrite=True)
+        self.assertEqual(code, 200)
+        env = ActiveEnvironment('test-nim-cache').get_env_instance()
+        self.assertIs(ActiveEnvironment('test-nim-cache').get_env_instance(), env)
+
+        code, _ = self.admin.make_env('simple_nim.environment:Environment', 'test-nim-cache',
+                                      'Test Environment (Nim)', config={'strong': False, 'random_start': False},
+                                      overwrite=True)
+        self.assertEqual(code, 200)
+        env2 = ActiveEnvironment('test-nim-cache').get_env_instance()
+        self.assertIsNot(env2, env)
+        self.assertFalse(env2.config_json['strong'])
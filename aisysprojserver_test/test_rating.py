@@ -0,0 +1,65 @@
+import random
+import statistics
+import unittest
+
+from aisysprojserver import rating
+from aisysprojserver.env_settings import EnvSettings
+
+
+def make_strategy(name: str, window: int = 7) -> rating.RatingStrategy:
+    settings = EnvSettings()
+    settings.RATING_STRATEGY = name
+    settings.MIN_RUNS_FOR_FULLY_EVALUATED = window
+    return rating.get_rating_strategy(settings)
+
+
+class RatingTest(unittest.TestCase):
+    def check_windowed(self, name: str, reference):
+        strategy = make_strategy(name)
+        state = strategy.initial_state()
+        results = [random.Random(i).randint(-10, 10) / 4 for i in range(30)]
+        for i, result in enumerate(results):
+            # the state is stored between updates
+            state = strategy.update(rating.decode_state(strategy, rating.encode_state(strategy, state), None), result)
+            self.assertAlmostEqual(strategy.get_rating(state), reference(results[max(i - 6, 0):i + 1]))
+        self.assertEqual(len(state['values']), 7)
+
+    def test_average(self):
+        self.check_windowed('average', statistics.mean)
+
+    def test_median(self):
+        self.check_windowed('median', statistics.median)
+
+    def test_window_size_change(self):
+        strategy = make_strategy('average', window=3)
+        state = strategy.from_results([1, 2, 3, 4, 5])
+        strategy = make_strategy('average', window=4)
+        self.assertEqual(strategy.get_rating(strategy.update(state, 6)), 4.5)
+
+    def test_ema(self):
+        strategy = make_strategy('ema', window=3)
+        self.assertEqual(strategy.get_rating(strategy.from_results([1, 3])), 2)
+        self.assertEqual(strategy.get_rating(strategy.from_results([1, 3, 0])), 1)
+
+    def test_elo(self):
+        strategy = make_strategy('elo')
+        strategy.settings.INITIAL_RATING = strategy.settings.ELO_OPPONENT_RATING
+        self.assertEqual(strategy.get_rating(strategy.from_results([1])), 1516)
+        self.assertLess(strategy.get_rating(strategy.from_results([0, 0.5])), 1500)
+
+    def test_packed_size(self):
+        strategy = make_strategy('average', window=50)
+        sizes = {len(rating.encode_state(strategy, strategy.from_results(list(range(n))))) for n in [50, 51, 1000]}
+        self.assertEqual(sizes, {len(b'average\0') + 4 + 51 * 8})
+        for name in ['ema', 'elo']:
+            strategy = make_strategy(name)
+            for state in [strategy.initial_state(), strategy.from_results([1, 0])]:
+                self.assertEqual(rating.decode_state(strategy, rating.encode_state(strategy, state), None), state)
+
+    def test_legacy_results(self):
+        strategy = make_strategy('average', window=3)
+        self.assertEqual(strategy.get_rating(rating.decode_state(strategy, None, '[1, 2, 3, 4]')), 3)
+        # switching between windowed strategies keeps the results
+        median = make_strategy('median', window=3)
+        state = rating.decode_state(median, rating.encode_state(strategy, strategy.from_results([1, 2, 6])), None)
+        self.assertEqual(median.get_rating(state), 2)
@@ -0,0 +1,58 @@
+from unittest import mock
+
+from aisysprojserver import models, run_pool, act
+from aisysprojserver.active_env import ActiveEnvironment
+from aisysprojserver_test.batch_env import PooledBatchEnvironment
+from aisysprojserver_test.servertestcase import ServerTestCase
+
+
+class RunPoolTest(ServerTestCase):
+    def make_env(self):
+        code, _ = self.admin.make_env('aisysprojserver_test.batch_env:PooledBatchEnvironment', 'test-pool',
+                                      'Pooled Environment', overwrite=True)
+        self.assertEqual(code, 200)
+
+    def get_action_requests(self) -> list:
+        code, agent = self.admin.new_user('test-pool', self.get_username())
+        self.assertEqual(code, 200)
+        code, content = self.admin.send_request('/act/test-pool', method='PUT', json={
+            'agent': agent['agent'], 'pwd': agent['pwd'], 'protocol_version': 1, 'actions': [],
+        })
+        self.assertEqual(code, 200, content)
+        return content['action_requests']
+
+    def get_pool_size(self) -> int:
+        with models.Session() as session:
+            return run_pool.get_pool_size(session, 'test-pool')
+
+    def test_run_pool(self):
+        self.require_standard_setup()
+        self.make_env()
+        PooledBatchEnvironment.calls.clear()
+
+        self.assertEqual(run_pool.fill(ActiveEnvironment('test-pool')), 4)
+        self.assertEqual(run_pool.fill(ActiveEnvironment('test-pool')), 0)
+        self.assertEqual(self.get_pool_size(), 4)
+
+        # the first agent gets runs from the pool (whose states are stored without serializing them again),
+        # the second one only partially
+        with mock.patch('aisysprojserver.act.encode_state', wraps=act.encode_state) as encode_state:
+            self.assertEqual(len(self.get_action_requests()), 3)
+        encode_state.assert_not_called()
+        self.assertEqual(self.get_pool_size(), 1)
+        self.assertEqual(len(self.get_action_requests()), 3)
+        self.assertEqual(self.get_pool_size(), 0)
+        self.assertEqual([call for call in PooledBatchEnvironment.calls if call[0] == 'new_runs'],
+                         [('new_runs', 4), ('new_runs', 2)])
+
+        run_pool.fill_all()
+        self.assertEqual(self.get_pool_size(), 4)
+        self.make_env()     # re-creating the environment clears the pool
+        self.assertEqual(self.get_pool_size(), 0)
+
+    def test_environment_without_new_states(self):
+        self.require_standard_setup()
+        self.make_env()
+        with mock.patch.object(PooledBatchEnvironment, 'new_runs', return_value=[]):
+            self.assertEqual(run_pool.fill(ActiveEnvironment('test-pool')), 0)
+        self.assertEqual(self.get_pool_size(), 0)
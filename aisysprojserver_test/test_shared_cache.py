@@ -0,0 +1,51 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from flask import Flask
+from flask_caching import Cache     # type: ignore
+
+from aisysprojserver.shared_cache import SQLiteStore
+
+
+class SharedCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / 'cache.db'
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_lru_eviction(self):
+        store = SQLiteStore(self.path, max_size=2 * 101)
+        store.ACCESS_TIME_RESOLUTION = 0
+        for key in 'abc':
+            store.set(key, b'x' * 100)
+            time.sleep(0.01)
+        self.assertEqual(store.get('a'), b'x' * 100)   # b is the least recently used entry now
+        store.evict()
+        self.assertEqual([key for key in 'abc' if store.has(key)], ['a', 'c'])
+
+    def test_expiration(self):
+        store = SQLiteStore(self.path, max_size=1000)
+        store.set('a', b'1', timeout=-1)
+        self.assertIsNone(store.get('a'))
+        self.assertTrue(store.set('a', b'2', only_if_missing=True))
+        self.assertFalse(store.set('a', b'3', only_if_missing=True))
+        self.assertEqual(store.get('a'), b'2')
+
+    def test_flask_caching_backend(self):
+        app = Flask(__name__)
+        config = {
+            'CACHE_TYPE': 'aisysprojserver.shared_cache.SQLiteCache',
+            'CACHE_SQLITE_FILE': self.path,
+            'CACHE_SQLITE_MAX_SIZE': 1000,
+        }
+        caches = [Cache(app, config=config), Cache(app, config=config)]
+        with app.app_context():
+            self.assertTrue(caches[0].set('key', {'value': [1, 2]}))
+            self.assertEqual(caches[1].get('key'), {'value': [1, 2]})     # the caches share the database
+            self.assertFalse(caches[1].add('key', 'other value'))
+            self.assertTrue(caches[1].delete('key'))
+            self.assertIsNone(caches[0].get('key'))
@@ -0,0 +1,75 @@
+import importlib.util
+import unittest
+
+from aisysprojserver import models
+from aisysprojserver.run import Run, encode_state, decode_state, sample_state_compression
+from aisysprojserver_test.servertestcase import ServerTestCase
+
+HAS_NUMPY: bool = importlib.util.find_spec('numpy') is not None
+HAS_MSGPACK: bool = importlib.util.find_spec('msgpack') is not None
+
+
+class StateCodecTest(ServerTestCase):
+    def test_json(self):
+        state = {'board': [[1, 2], [3, 4]], 'player': 'x'}
+        self.assertEqual(encode_state(state), ('{"board":[[1,2],[3,4]],"player":"x"}', None))
+        self.assertEqual(decode_state(*encode_state(state)), state)
+
+    def test_compression(self):
+        state = {'board': [[0] * 100] * 100}
+        self.assertEqual(encode_state(state, compression_threshold=1000000)[1], None)
+        state_text, state_blob = encode_state(state, compression_threshold=1000)
+        self.assertIsNone(state_text)
+        assert state_blob is not None
+        self.assertTrue(state_blob.startswith(b'zlib+json\0'))
+        self.assertLess(len(state_blob), 1000)
+        self.assertEqual(decode_state(state_text, state_blob), state)
+
+    def test_compression_sample(self):
+        self.require_standard_setup()
+        state = {'board': [[0] * 100] * 100}
+        state_text, state_blob = encode_state(state, compression_threshold=1000)
+        assert state_blob is not None
+        with models.Session() as session:
+            session.add(models.RunModel(environment='test-nim', agent='test-nim/testuser', finished=False,
+                                        outstanding_action=False, state=state_text, state_blob=state_blob,
+                                        number_of_steps=0, outcome='null'))
+            session.flush()
+            compressed_size, original_size = sample_state_compression(session, sample_size=1)
+            session.rollback()
+        self.assertEqual(compressed_size, len(state_blob) - len(b'zlib+json\0'))
+        self.assertEqual(original_size, len(str(encode_state(state)[0])))
+
+    @unittest.skipUnless(HAS_MSGPACK and HAS_NUMPY, 'requires msgpack and numpy')
+    def test_msgpack(self):
+        import numpy
+        state = {'board': numpy.arange(6, dtype=numpy.uint8).reshape((2, 3)), 'player': 'x', 'raw': b'\x00\x01'}
+        state_text, state_blob = encode_state(state, 'msgpack')
+        self.assertIsNone(state_text)
+        decoded = decode_state(state_text, state_blob)
+        self.assertEqual(decoded['player'], 'x')
+        self.assertEqual(decoded['raw'], b'\x00\x01')
+        self.assertEqual(decoded['board'].dtype, numpy.uint8)
+        self.assertTrue((decoded['board'] == state['board']).all())
+
+    @unittest.skipUnless(HAS_NUMPY, 'requires numpy')
+    def test_numpy_environment(self):
+        import numpy
+        self.require_standard_setup()
+        code, _ = self.admin.make_env('aisysprojserver_test.numpy_env:NumpyEnvironment', 'test-numpy',
+                                      'Numpy Environment', overwrite=True)
+        self.assertEqual(code, 200)
+        code, agent = self.admin.new_user('test-numpy', self.get_username())
+        self.assertEqual(code, 200)
+
+        actions: list = []
+        for _ in range(3):
+            code, content = self.admin.send_request('/act/test-numpy', method='PUT', json={
+                'agent': agent['agent'], 'pwd': agent['pwd'], 'protocol_version': 1, 'actions': actions,
+            })
+            self.assertEqual(code, 200, content)
+            actions = [{'run': ar['run'], 'act_no': ar['act_no'], 'action': 2} for ar in content['action_requests']]
+
+        self.assertEqual(content['action_requests'][0]['percept'], [[4, 4, 4]] * 3)
+        state = Run(int(content['action_requests'][0]['run'])).get_state()
+        self.assertEqual(state.dtype, numpy.int8)
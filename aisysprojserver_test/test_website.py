@@ -0,0 +1,76 @@
+from unittest import mock
+
+import sqlalchemy
+
+from aisysprojserver import models, render_cache
+from aisysprojserver.active_env import ActiveEnvironment
+from aisysprojserver_test.servertestcase import ServerTestCase, get_strong_nim_move
+
+
+class WebsiteTest(ServerTestCase):
+    def test_env_page(self):
+        self.require_standard_setup()
+        self.assertEqual(self.act(self._testuser_content, 5, get_strong_nim_move), 200)
+        response = self.client.get('/env/test-nim')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('testuser', response.get_data(as_text=True))
+
+    def test_results(self):
+        self.require_standard_setup()
+        self.assertEqual(self.act(self._testuser_content, 5, get_strong_nim_move), 200)
+        results = self.admin.get_agent_results('test-nim')
+        self.assertIn('testuser', results)
+        self.assertIn('rating', results['testuser'])
+
+    def test_render_cache(self):
+        self.require_standard_setup()
+        code, _ = self.admin.make_env('simple_nim.environment:Environment', 'test-render', 'Render Test (Nim)',
+                                      config={'strong': True, 'random_start': False}, overwrite=True)
+        self.assertEqual(code, 200)
+        username = self.get_username()
+        code, agent = self.admin.new_user('test-render', username)
+        self.assertEqual(code, 200)
+        self.assertEqual(self.act(agent, 5, get_strong_nim_move), 200)
+
+        active_env = ActiveEnvironment('test-render')
+        version = active_env.get_content_version()
+        self.assertGreater(version, 0)
+        html = self.client.get('/env/test-render').get_data(as_text=True)
+        self.assertEqual(render_cache.get('test-render', 'env', version), html)
+        html = self.client.get(f'/agent/test-render/{username}').get_data(as_text=True)
+        self.assertEqual(render_cache.get('test-render', f'agent/{username}', version), html)
+
+        # finished runs are cached, the others are not
+        with models.Session() as session:
+            finished = {
+                run_id: is_finished for run_id, is_finished in session.execute(
+                    sqlalchemy.select(models.RunModel.identifier, models.RunModel.finished)
+                    .where(models.RunModel.environment == 'test-render')
+                )
+            }
+        self.assertEqual(set(finished.values()), {True, False})
+        for run_id, is_finished in finished.items():
+            html = self.client.get(f'/run/test-render/{run_id}').get_data(as_text=True)
+            self.assertEqual(render_cache.get('test-render', f'run/{run_id}', 0), html if is_finished else None)
+
+        # finishing runs invalidates the environment and agent pages
+        self.assertEqual(self.act(agent, 5, get_strong_nim_move), 200)
+        self.assertGreater(active_env.get_content_version(), version)
+        for page, url in [('env', '/env/test-render'), (f'agent/{username}', f'/agent/test-render/{username}')]:
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertIsNone(render_cache.get('test-render', page, version))
+
+    def test_render_cache_after_server_upgrade(self):
+        render_cache.put('test-render', 'env', 1, '<html></html>')
+        self.assertEqual(render_cache.get('test-render', 'env', 1), '<html></html>')
+        with mock.patch('aisysprojserver.render_cache.__version__', '999.0.0'):    # the templates might have changed
+            self.assertIsNone(render_cache.get('test-render', 'env', 1))
+
+    def test_disabled_render_cache(self):
+        configuration = self.helper.configuration
+        render_cache.setup(configuration.RENDER_CACHE_FILE, 0)
+        try:
+            render_cache.put('test-render', 'env', 1, '<html></html>')
+            self.assertIsNone(render_cache.get('test-render', 'env', 1))
+        finally:
+            render_cache.setup(configuration.RENDER_CACHE_FILE, configuration.RENDER_CACHE_MAX_SIZE)
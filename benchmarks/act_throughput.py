@@ -0,0 +1,90 @@
+""" Measures the throughput of the /act endpoint for different database configurations.
+
+Run from the repository root with ``python -m benchmarks.act_throughput``.
+Every configuration is benchmarked in a separate process with a fresh database.
+Note that the differences between configurations mostly depend on how expensive fsyncs are on the used disk.
+"""
+import argparse
+import multiprocessing
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from aisysprojserver.config import TestConfig
+from aisysprojserver_clienttools.admin import AdminClient
+
+EXAMPLE_ENV = Path(__file__).parent.parent / 'example_envs' / 'simple_nim'
+
+PROFILES: dict[str, dict[str, str | int]] = {
+    'sqlite-defaults': {},
+    'sqlite-tuned': TestConfig.SQLITE_PRAGMAS,
+}
+
+
+class _BenchmarkAdmin(AdminClient):
+    def __init__(self, client):
+        AdminClient.__init__(self, 'http://localhost:5001', 'test-admin-password')
+        self.client = client
+
+    def send_request(self, path: str, **kwargs) -> tuple[int, Any]:
+        response = self.client.open(path, **kwargs)
+        return response.status_code, response.get_json()
+
+
+def _strong_nim_move(percept: int) -> int:
+    return max(percept % 4, 1)
+
+
+def _run_profile(pragmas: dict[str, str | int], number_of_requests: int, directory: Optional[str], results) -> None:
+    from aisysprojserver.app import create_app
+
+    with tempfile.TemporaryDirectory(dir=directory) as tmpdir:
+        class BenchmarkConfig(TestConfig):
+            PERSISTENT = Path(tmpdir)
+            PROMETHEUS_PORT = None
+            SQLITE_PRAGMAS = pragmas
+
+        admin = _BenchmarkAdmin(create_app(BenchmarkConfig()).test_client())
+        assert admin.upload_plugin(EXAMPLE_ENV)[0] == 200
+        assert admin.make_env('simple_nim.environment:Environment', 'bench-nim', 'Benchmark (Nim)',
+                              config={'strong': True, 'random_start': False})[0] == 200
+        code, agent = admin.new_user('bench-nim', 'benchmark-agent')
+        assert code == 200
+
+        actions: list[dict] = []
+        number_of_actions = 0
+        start = time.perf_counter()
+        for _ in range(number_of_requests):
+            code, content = admin.send_request('/act/bench-nim', method='PUT', json={
+                'agent': agent['agent'], 'pwd': agent['pwd'], 'protocol_version': 1, 'actions': actions,
+            })
+            assert code == 200, content
+            number_of_actions += len(actions)
+            actions = [
+                {'run': ar['run'], 'act_no': ar['act_no'], 'action': _strong_nim_move(ar['percept'])}
+                for ar in content['action_requests']
+            ]
+        duration = time.perf_counter() - start
+        results.put((number_of_requests / duration, number_of_actions / duration))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=1000, help='number of /act requests per configuration')
+    parser.add_argument('--directory', default=None,
+                        help='directory for the database (should be on the disk of interest)')
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('spawn')
+    for name, pragmas in PROFILES.items():
+        results = ctx.Queue()
+        process = ctx.Process(target=_run_profile, args=(pragmas, args.requests, args.directory, results))
+        process.start()
+        requests_per_second, actions_per_second = results.get()
+        process.join()
+        print(f'{name:20} {requests_per_second:8.1f} requests/s {actions_per_second:8.1f} actions/s')
+
+
+if __name__ == '__main__':
+    main()